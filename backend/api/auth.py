@@ -4,10 +4,11 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
-from services.database import get_db
+from services.database import get_async_db
 from services.auth import (
     verify_password,
     create_access_token,
@@ -38,7 +39,7 @@ class UserResponse(BaseModel):
 async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """用户登录"""
     # 获取客户端 IP
@@ -52,7 +53,7 @@ async def login(
             detail=f"登录尝试次数过多，IP 已锁定 {remaining_minutes} 分钟",
         )
 
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await db.scalar(select(User).where(User.username == form_data.username))
 
     if not user or not verify_password(form_data.password, user.hashed_password):
         # 记录失败
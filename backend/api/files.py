@@ -1,15 +1,48 @@
 """
 文件操作 API
-支持目录浏览、文件读取、文件写入
+支持目录浏览、文件读取、文件写入、文件搜索
 """
-from fastapi import APIRouter, HTTPException, Query, Depends
-from fastapi.responses import PlainTextResponse, Response
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse, FileResponse, JSONResponse
 from pydantic import BaseModel
 import os
+import re
+import json
+import asyncio
+import logging
+import threading
 import mimetypes
 import base64
 from pathlib import Path
 from typing import Optional, List
+from urllib.parse import quote
+
+from config import settings
+from services.auth import verify_token_async
+from services.file_search import (
+    NameMatcher, SEARCH_MODES, search_names, compile_content_pattern, search_contents
+)
+from services.fs_walker import iterate_in_thread
+from services.archive_service import ARCHIVE_FORMATS, ARCHIVE_MEDIA_TYPES, write_archive
+from services.fs_watcher import WatchSession, WatchLimitExceeded
+from services.blocking_io import run_io
+from services.file_ops import (
+    atomic_write, apply_line_edits, mtime_matches, sha256_bytes, read_bytes
+)
+from services.job_service import job_manager, JOB_TYPES
+from services.du_service import du_cache
+from services.encoding import decode_bytes, encoding_cache
+from services.http_cache import (
+    stat_etag, digest_etag, is_not_modified, cache_headers, not_modified_response
+)
+from services.thumbnail_service import (
+    thumbnail_cache, ThumbnailUnavailable, THUMBNAIL_SIZES, THUMBNAIL_EXTENSIONS, pillow_available
+)
+from services.upload_service import (
+    upload_manager, UploadError, UploadNotFound, UploadBusy, OffsetMismatch, ChecksumMismatch
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -33,6 +66,7 @@ class FileInfo(BaseModel):
     modified: float
     extension: Optional[str] = None
     mime_type: Optional[str] = None
+    size_pending: Optional[bool] = None  # 目录占用尚未统计，需调用 /du 获取
 
 
 class DirectoryListing(BaseModel):
@@ -45,6 +79,23 @@ class DirectoryListing(BaseModel):
 class FileWriteRequest(BaseModel):
     """文件写入请求"""
     content: str
+    expected_mtime: Optional[float] = None  # 期望的当前修改时间，不一致返回 409
+    expected_sha256: Optional[str] = None  # 期望的当前内容 SHA-256，不一致返回 409
+
+
+class LineEdit(BaseModel):
+    """行区间编辑：用 text 替换 [start_line, end_line) 行"""
+    start_line: int
+    end_line: int
+    text: str
+
+
+class FileEditRequest(BaseModel):
+    """文件补丁编辑请求"""
+    edits: List[LineEdit]
+    encoding: str = "utf-8"
+    expected_mtime: Optional[float] = None
+    expected_sha256: Optional[str] = None
 
 
 class PathRequest(BaseModel):
@@ -52,6 +103,29 @@ class PathRequest(BaseModel):
     path: str
 
 
+class BatchStatRequest(BaseModel):
+    """批量获取文件信息请求"""
+    paths: List[str]
+
+
+class JobRequest(BaseModel):
+    """后台任务请求"""
+    type: str  # delete / copy / move / archive / du
+    path: str
+    dest: Optional[str] = None  # copy / move / archive 的目标路径
+    format: str = "tar.gz"  # archive 格式
+    exclude: Optional[List[str]] = None  # archive 排除的 glob
+    respect_gitignore: bool = False  # archive 是否遵循 .gitignore
+
+
+class UploadInitRequest(BaseModel):
+    """分块上传初始化请求"""
+    path: str
+    size: int
+    sha256: Optional[str] = None  # 整个文件的 SHA-256，完成时校验
+    overwrite: bool = False
+
+
 def is_path_allowed(path: str) -> bool:
     """检查路径是否允许访问"""
     if ALLOWED_BASE_DIRS is None:
@@ -64,6 +138,72 @@ def is_path_allowed(path: str) -> bool:
     return False
 
 
+def normalize_path(path: str) -> str:
+    """展开 ~ 并规范化为绝对路径"""
+    path = os.path.expanduser(path)
+    path = os.path.normpath(path)
+    if not os.path.isabs(path):
+        path = "/" + path
+    return path
+
+
+def _require_directory(path: str):
+    """路径必须是已存在的目录（阻塞，在文件 I/O 线程池中调用）"""
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="路径不存在")
+
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="不是有效的目录")
+
+
+def _require_file(path: str):
+    """路径必须是已存在的文件（阻塞，在文件 I/O 线程池中调用）"""
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail="不是有效的文件")
+
+
+def ndjson_stream(items):
+    """将异步迭代的 dict 序列化为 NDJSON 流（每行一个 JSON 对象）"""
+    async def generate():
+        async for item in items:
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def check_write_conflict(
+    path: str,
+    expected_mtime: Optional[float],
+    expected_sha256: Optional[str],
+    current: Optional[bytes] = None
+):
+    """检查文件自客户端读取后是否被修改，冲突时抛出 409"""
+    if expected_mtime is None and expected_sha256 is None:
+        return
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail={"message": "文件已被删除"})
+
+    conflict = expected_mtime is not None and not mtime_matches(stat, expected_mtime)
+    current_sha256 = None
+    if expected_sha256 is not None:
+        if current is None:
+            with open(path, 'rb') as f:
+                current = f.read()
+        current_sha256 = sha256_bytes(current)
+        conflict = conflict or current_sha256 != expected_sha256.lower()
+
+    if conflict:
+        raise HTTPException(status_code=409, detail={
+            "message": "文件已被其他程序修改",
+            "modified": stat.st_mtime,
+            "sha256": current_sha256
+        })
+
+
 def get_file_info(path: str) -> FileInfo:
     """获取文件信息"""
     stat = os.stat(path)
@@ -89,15 +229,27 @@ def get_file_info(path: str) -> FileInfo:
 
 @router.get("/list", response_model=DirectoryListing)
 async def list_directory(
+    http_request: Request,
     path: str = Query("/", description="要列出的目录路径"),
-    show_hidden: bool = Query(False, description="是否显示隐藏文件")
+    show_hidden: bool = Query(False, description="是否显示隐藏文件"),
+    dir_sizes: bool = Query(False, description="是否填充已缓存的目录占用")
 ):
     """
     列出目录内容
 
     - **path**: 目录路径，默认为根目录
     - **show_hidden**: 是否显示隐藏文件（以 . 开头的文件）
+    - **dir_sizes**: 为 true 时目录的 size 取自占用统计缓存（不触发扫描），
+      未缓存的目录标记 size_pending，由客户端按需调用 /du
+
+    支持 If-None-Match / If-Modified-Since，目录内容未变化时返回 304
     """
+    return await run_io(_list_directory, path, show_hidden, http_request.headers, dir_sizes,
+                        request=http_request)
+
+
+def _list_directory(path: str, show_hidden: bool, headers=None, dir_sizes: bool = False):
+    """list_directory 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -126,7 +278,12 @@ async def list_directory(
 
             item_path = os.path.join(path, item_name)
             try:
-                items.append(get_file_info(item_path))
+                info = get_file_info(item_path)
+                if dir_sizes and info.is_dir:
+                    cached_size = du_cache.cached_size(item_path)
+                    info.size = cached_size or 0
+                    info.size_pending = cached_size is None
+                items.append(info)
             except (PermissionError, OSError):
                 # 跳过无权限访问的文件
                 continue
@@ -139,11 +296,24 @@ async def list_directory(
         if parent and not is_path_allowed(parent):
             parent = None  # 不允许访问上级目录
 
-        return DirectoryListing(
+        listing = DirectoryListing(
             path=path,
             parent=parent,
             items=items
         )
+
+        # 目录自身的 mtime 不反映子文件内容变化，ETag 由各条目的大小和修改时间计算；
+        # 子目录大小统计完成后 size_pending 改变（大小可能仍为 0），也要计入
+        dir_stat = os.stat(path)
+        etag = digest_etag(
+            [path, show_hidden, dir_sizes, dir_stat.st_mtime_ns]
+            + [(item.name, item.is_dir, item.size, item.modified, item.size_pending) for item in items]
+        )
+        # 子目录大小的变化不体现在修改时间上，统计子目录大小时只用 ETag 校验
+        last_modified = None if dir_sizes else max([dir_stat.st_mtime] + [item.modified for item in items])
+        if is_not_modified(headers, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        return JSONResponse(listing.model_dump(), headers=cache_headers(etag, last_modified))
     except PermissionError:
         raise HTTPException(status_code=403, detail="无权限访问该目录")
     except Exception as e:
@@ -152,6 +322,7 @@ async def list_directory(
 
 @router.get("/read")
 async def read_file(
+    http_request: Request,
     path: str = Query(..., description="要读取的文件路径"),
     encoding: str = Query("utf-8", description="文件编码"),
     start_line: int = Query(0, description="起始行号（从0开始）"),
@@ -164,7 +335,15 @@ async def read_file(
     - **encoding**: 文件编码，默认 UTF-8
     - **start_line**: 起始行号，用于大文件分页
     - **line_count**: 读取行数，0 表示读取全部
+
+    支持 If-None-Match / If-Modified-Since，文件未变化时返回 304
     """
+    return await run_io(_read_file, path, encoding, start_line, line_count, http_request.headers,
+                        request=http_request)
+
+
+def _read_file(path: str, encoding: str, start_line: int, line_count: int, headers=None):
+    """read_file 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -194,71 +373,69 @@ async def read_file(
         )
 
     try:
-        with open(path, 'r', encoding=encoding) as f:
-            if start_line > 0 or line_count > 0:
-                # 分页读取
-                lines = []
-                for i, line in enumerate(f):
-                    if i < start_line:
-                        continue
-                    if line_count > 0 and i >= start_line + line_count:
-                        break
-                    lines.append(line)
-                content = ''.join(lines)
-                total_lines = i + 1 if 'i' in dir() else 0
-            else:
-                # 读取全部
-                content = f.read()
-                total_lines = content.count('\n') + 1
-
-        # 获取文件信息
-        file_info = get_file_info(path)
-
-        return {
-            "path": path,
-            "content": content,
-            "size": file_size,
-            "lines": total_lines,
-            "encoding": encoding,
-            "mime_type": file_info.mime_type,
-            "extension": file_info.extension
-        }
-    except UnicodeDecodeError:
-        # 尝试其他编码
-        alternative_encodings = ['gbk', 'gb2312', 'latin-1']
-        for enc in alternative_encodings:
-            try:
-                with open(path, 'r', encoding=enc) as f:
-                    content = f.read()
-                return {
-                    "path": path,
-                    "content": content,
-                    "size": file_size,
-                    "lines": content.count('\n') + 1,
-                    "encoding": enc,
-                    "mime_type": file_info.mime_type,
-                    "extension": file_info.extension
-                }
-            except UnicodeDecodeError:
-                continue
-        raise HTTPException(status_code=400, detail="无法解码文件内容，可能是二进制文件")
+        # 只读取一次：编码检测、解码、分页都基于同一份字节内容
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            # 返回内容经过解码和分页，使用弱 ETag
+            etag = stat_etag(stat, weak=True)
+            if is_not_modified(headers, etag, stat.st_mtime):
+                return not_modified_response(etag, stat.st_mtime)
+            data = f.read()
     except PermissionError:
         raise HTTPException(status_code=403, detail="无权限读取该文件")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取文件失败: {str(e)}")
 
+    cache_key = (path, stat.st_mtime_ns, stat.st_size, encoding)
+    content, used_encoding = decode_bytes(data, encoding, known=encoding_cache.get(cache_key))
+    encoding_cache.put(cache_key, used_encoding)
+    # 与文本模式读取保持一致：统一换行符为 \n
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+
+    if start_line > 0 or line_count > 0:
+        # 分页读取（对所有编码生效）
+        parts = content.split('\n')
+        lines = [part + '\n' for part in parts[:-1]]
+        if parts[-1]:
+            lines.append(parts[-1])
+        total_lines = len(lines)
+        end_line = start_line + line_count if line_count > 0 else total_lines
+        content = ''.join(lines[start_line:end_line])
+    else:
+        total_lines = content.count('\n') + 1
+
+    extension = os.path.splitext(path)[1].lower()
+    mime_type, _ = mimetypes.guess_type(path)
+    return JSONResponse({
+        "path": path,
+        "content": content,
+        "size": stat.st_size,
+        "lines": total_lines,
+        "encoding": used_encoding,
+        "mime_type": mime_type,
+        "extension": extension,
+        "modified": stat.st_mtime
+    }, headers=cache_headers(etag, stat.st_mtime))
+
 
 @router.post("/write")
 async def write_file(
+    http_request: Request,
     path: str = Query(..., description="要写入的文件路径"),
     request: FileWriteRequest = None
 ):
     """
-    写入文件内容
+    写入文件内容（临时文件 + 重命名，原子替换）
 
     - **path**: 文件路径
     - **content**: 文件内容
+    - **expected_mtime** / **expected_sha256**: 可选，文件已被修改时返回 409
     """
+    return await run_io(_write_file, path, request, request=http_request)
+
+
+def _write_file(path: str, request: FileWriteRequest):
+    """write_file 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -276,10 +453,19 @@ async def write_file(
         raise HTTPException(status_code=400, detail="目录不存在")
 
     try:
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(request.content)
+        check_write_conflict(path, request.expected_mtime, request.expected_sha256)
+        data = request.content.encode('utf-8')
+        stat = atomic_write(path, data)
 
-        return {"success": True, "path": path, "size": len(request.content)}
+        return {
+            "success": True,
+            "path": path,
+            "size": len(request.content),
+            "modified": stat.st_mtime,
+            "sha256": sha256_bytes(data)
+        }
+    except HTTPException:
+        raise
     except PermissionError:
         raise HTTPException(status_code=403, detail="无权限写入该文件")
     except Exception as e:
@@ -287,10 +473,18 @@ async def write_file(
 
 
 @router.get("/stat")
-async def get_file_stat(path: str = Query(..., description="文件路径")):
+async def get_file_stat(
+    http_request: Request,
+    path: str = Query(..., description="文件路径")
+):
     """
     获取文件详细信息
     """
+    return await run_io(_get_file_stat, path, request=http_request)
+
+
+def _get_file_stat(path: str):
+    """get_file_stat 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -325,13 +519,81 @@ async def get_file_stat(path: str = Query(..., description="文件路径")):
         raise HTTPException(status_code=500, detail=f"获取文件信息失败: {str(e)}")
 
 
+@router.post("/stat/batch")
+async def get_file_stat_batch(request: BatchStatRequest):
+    """
+    批量获取文件详细信息（并发执行）
+
+    - **paths**: 路径列表，最多 200 个
+
+    结果顺序与请求一致，每项为 `{"ok": true, "stat": {...}}`
+    或 `{"ok": false, "status": 404, "error": "..."}`，单个路径失败不影响其他路径。
+    """
+    if len(request.paths) > 200:
+        raise HTTPException(status_code=400, detail="单次最多查询 200 个路径")
+
+    results = await asyncio.gather(*(run_io(_stat_batch_item, path) for path in request.paths))
+    return {"results": list(results)}
+
+
+def _stat_batch_item(path: str) -> dict:
+    """单个路径的批量查询结果，错误转为结果项而不是异常"""
+    try:
+        return {"path": path, "ok": True, "stat": _get_file_stat(path)}
+    except HTTPException as e:
+        return {"path": path, "ok": False, "status": e.status_code, "error": e.detail}
+
+
+@router.get("/du")
+async def get_disk_usage(
+    http_request: Request,
+    path: str = Query(..., description="要统计的目录路径"),
+    refresh: bool = Query(False, description="忽略缓存重新扫描整个目录树")
+):
+    """
+    统计目录占用空间（按磁盘块计算，不跟随符号链接）
+
+    - **path**: 目录路径
+    - **refresh**: 强制全量扫描；默认只重新扫描 mtime 变化过的目录
+
+    返回总占用及按占用降序排列的直接子目录，便于逐层定位大目录
+    """
+    return await run_io(_get_disk_usage, path, refresh, request=http_request, cancellable=True)
+
+
+def _get_disk_usage(path: str, refresh: bool, cancel_event: threading.Event):
+    """get_disk_usage 的阻塞实现（在文件 I/O 线程池中执行）"""
+    path = normalize_path(path)
+
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+    if not os.path.isdir(path) or os.path.islink(path):
+        raise HTTPException(status_code=400, detail="不是有效的目录")
+
+    try:
+        result = du_cache.compute(path, refresh=refresh, cancel_event=cancel_event)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="路径不存在")
+    if result is None:
+        raise HTTPException(status_code=499, detail="客户端已断开")
+    return result
+
+
 @router.post("/create")
-async def create_file(request: PathRequest):
+async def create_file(
+    http_request: Request,
+    request: PathRequest
+):
     """
     创建新文件
 
     - **path**: 文件路径
     """
+    return await run_io(_create_file, request, request=http_request)
+
+
+def _create_file(request: PathRequest):
+    """create_file 的阻塞实现（在文件 I/O 线程池中执行）"""
     path = request.path
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
@@ -366,12 +628,20 @@ async def create_file(request: PathRequest):
 
 
 @router.post("/mkdir")
-async def create_directory(request: PathRequest):
+async def create_directory(
+    http_request: Request,
+    request: PathRequest
+):
     """
     创建新目录
 
     - **path**: 目录路径
     """
+    return await run_io(_create_directory, request, request=http_request)
+
+
+def _create_directory(request: PathRequest):
+    """create_directory 的阻塞实现（在文件 I/O 线程池中执行）"""
     path = request.path
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
@@ -399,12 +669,22 @@ async def create_directory(request: PathRequest):
 
 
 @router.delete("/delete")
-async def delete_file_or_dir(path: str = Query(..., description="要删除的文件或目录路径")):
+async def delete_file_or_dir(
+    http_request: Request,
+    path: str = Query(..., description="要删除的文件或目录路径")
+):
     """
     删除文件或目录
 
     - **path**: 文件或目录路径
+
+    目录在后台任务中删除，响应中的 job_id 可用于查询进度或取消。
     """
+    return await run_io(_delete_file_or_dir, path, request=http_request)
+
+
+def _delete_file_or_dir(path: str):
+    """delete_file_or_dir 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -421,12 +701,12 @@ async def delete_file_or_dir(path: str = Query(..., description="要删除的文
         raise HTTPException(status_code=404, detail="文件或目录不存在")
 
     try:
-        if os.path.isfile(path):
-            os.remove(path)
-        elif os.path.isdir(path):
-            import shutil
-            shutil.rmtree(path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            # 目录可能很大（如 node_modules），交给后台任务删除，立即返回任务 ID
+            job = job_manager.submit("delete", {"path": path})
+            return {"success": True, "path": path, "job_id": job.id}
 
+        os.remove(path)
         return {"success": True, "path": path}
     except PermissionError:
         raise HTTPException(status_code=403, detail="无权限删除")
@@ -435,12 +715,23 @@ async def delete_file_or_dir(path: str = Query(..., description="要删除的文
 
 
 @router.get("/binary")
-async def read_binary_file(path: str = Query(..., description="要读取的文件路径")):
+async def read_binary_file(
+    http_request: Request,
+    path: str = Query(..., description="要读取的文件路径")
+):
     """
     读取二进制文件（如图片），返回 base64 编码
 
     - **path**: 文件路径
+
+    支持 If-None-Match / If-Modified-Since，文件未变化时返回 304
     """
+    return await run_io(_read_binary_file, path, http_request.headers,
+                        request=http_request, cancellable=True)
+
+
+def _read_binary_file(path: str, headers=None, cancel_event: threading.Event = None):
+    """read_binary_file 的阻塞实现（在文件 I/O 线程池中执行）"""
     # 展开 ~ 为用户目录
     path = os.path.expanduser(path)
     # 规范化路径
@@ -461,7 +752,8 @@ async def read_binary_file(path: str = Query(..., description="要读取的文
         raise HTTPException(status_code=400, detail="不是有效的文件")
 
     # 检查文件大小（限制大文件）
-    file_size = os.path.getsize(path)
+    stat = os.stat(path)
+    file_size = stat.st_size
     max_size = 50 * 1024 * 1024  # 50MB
     if file_size > max_size:
         raise HTTPException(
@@ -469,9 +761,14 @@ async def read_binary_file(path: str = Query(..., description="要读取的文
             detail=f"文件过大（{file_size / 1024 / 1024:.2f}MB），超过限制（50MB）"
         )
 
+    etag = stat_etag(stat)
+    if is_not_modified(headers, etag, stat.st_mtime):
+        return not_modified_response(etag, stat.st_mtime)
+
     try:
-        with open(path, 'rb') as f:
-            content = f.read()
+        content = read_bytes(path, cancel_event)
+        if content is None:
+            raise HTTPException(status_code=499, detail="客户端已断开")
 
         # 获取 MIME 类型
         mime_type, _ = mimetypes.guess_type(path)
@@ -481,13 +778,577 @@ async def read_binary_file(path: str = Query(..., description="要读取的文
         # 返回 base64 编码
         base64_content = base64.b64encode(content).decode('utf-8')
 
-        return {
+        return JSONResponse({
             "path": path,
             "mime_type": mime_type,
             "size": file_size,
             "base64": base64_content
-        }
+        }, headers=cache_headers(etag, stat.st_mtime))
+    except HTTPException:
+        raise
     except PermissionError:
         raise HTTPException(status_code=403, detail="无权限读取该文件")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取文件失败: {str(e)}")
+
+
+@router.get("/search")
+async def search_files(
+    path: str = Query(..., description="搜索根目录"),
+    pattern: str = Query(..., min_length=1, description="文件名匹配模式"),
+    mode: str = Query("glob", description="匹配方式: glob / fuzzy / substring"),
+    case_sensitive: bool = Query(False, description="是否区分大小写"),
+    show_hidden: bool = Query(False, description="是否包含隐藏文件"),
+    respect_gitignore: bool = Query(True, description="是否遵循 .gitignore 规则"),
+    include_dirs: bool = Query(True, description="结果是否包含目录"),
+    max_results: int = Query(500, ge=1, description="最大结果数"),
+    timeout: float = Query(10.0, gt=0, description="搜索超时（秒）")
+):
+    """
+    递归搜索文件名，以 NDJSON 流式返回
+
+    - **path**: 搜索根目录
+    - **pattern**: 匹配模式，glob 模式下含 `/` 时匹配相对路径
+    - **mode**: glob（通配符）、fuzzy（模糊子序列）、substring（子串）
+
+    每找到一个结果输出一行 `{"type": "match", ...}`，
+    最后输出一行 `{"type": "done", ...}` 汇总（是否截断、是否超时）。
+    """
+    path = normalize_path(path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    await run_io(_require_directory, path)
+
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的匹配方式: {mode}")
+
+    matcher = NameMatcher(pattern, mode=mode, case_sensitive=case_sensitive)
+    max_results = min(max_results, settings.file_search_max_results)
+    timeout = min(timeout, settings.file_search_max_seconds)
+
+    def producer(emit, cancel_event):
+        summary = search_names(
+            path,
+            matcher,
+            emit,
+            cancel_event,
+            workers=settings.file_search_workers,
+            show_hidden=show_hidden,
+            respect_gitignore=respect_gitignore,
+            include_dirs=include_dirs,
+            max_results=max_results,
+            timeout=timeout,
+        )
+        emit(summary)
+
+    return ndjson_stream(iterate_in_thread(producer))
+
+
+@router.get("/grep")
+async def grep_files(
+    path: str = Query(..., description="搜索根目录（通常为任务工作目录）"),
+    pattern: str = Query(..., min_length=1, description="搜索内容"),
+    regex: bool = Query(False, description="pattern 是否为正则表达式"),
+    case_sensitive: bool = Query(False, description="是否区分大小写"),
+    include: Optional[str] = Query(None, description="只搜索匹配该 glob 的文件，如 *.py"),
+    context: int = Query(0, ge=0, le=10, description="命中行前后附带的上下文行数"),
+    show_hidden: bool = Query(False, description="是否搜索隐藏文件"),
+    respect_gitignore: bool = Query(True, description="是否遵循 .gitignore 规则"),
+    max_matches: int = Query(1000, ge=1, description="最大命中行数"),
+    timeout: float = Query(10.0, gt=0, description="搜索超时（秒）")
+):
+    """
+    搜索文件内容，以 NDJSON 流式返回
+
+    - **path**: 搜索根目录
+    - **pattern**: 字面量或正则（regex=true）
+    - **include**: 文件名过滤 glob
+
+    每个有命中的文件输出一行 `{"type": "file", "matches": [...]}`，
+    其中每条命中包含行号、列号、行内容及上下文；
+    最后输出一行 `{"type": "done", ...}` 汇总。二进制文件会被跳过。
+    """
+    path = normalize_path(path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    await run_io(_require_directory, path)
+
+    try:
+        compiled = compile_content_pattern(pattern, is_regex=regex, case_sensitive=case_sensitive)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"无效的正则表达式: {e}")
+
+    include_matcher = NameMatcher(include, mode="glob") if include else None
+    max_matches = min(max_matches, settings.file_search_max_results)
+    timeout = min(timeout, settings.file_search_max_seconds)
+
+    def producer(emit, cancel_event):
+        summary = search_contents(
+            path,
+            compiled,
+            emit,
+            cancel_event,
+            include=include_matcher,
+            context=context,
+            workers=settings.file_search_workers,
+            show_hidden=show_hidden,
+            respect_gitignore=respect_gitignore,
+            max_matches=max_matches,
+            max_file_size=settings.file_grep_max_file_size,
+            timeout=timeout,
+        )
+        emit(summary)
+
+    return ndjson_stream(iterate_in_thread(producer))
+
+
+def upload_error_to_http(e: UploadError) -> HTTPException:
+    """将上传服务错误转换为 HTTP 错误"""
+    if isinstance(e, UploadNotFound):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, UploadBusy):
+        return HTTPException(status_code=409, detail=str(e))
+    if isinstance(e, OffsetMismatch):
+        return HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    if isinstance(e, ChecksumMismatch):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/upload/init")
+async def init_upload(request: UploadInitRequest):
+    """
+    初始化分块上传
+
+    - **path**: 目标文件路径
+    - **size**: 文件总大小（字节）
+    - **sha256**: 可选，整个文件的 SHA-256
+    - **overwrite**: 目标已存在时是否覆盖
+
+    返回 upload_id 与建议分块大小，之后按顺序 PUT 分块。
+    """
+    path = normalize_path(request.path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    if request.size < 0 or request.size > settings.upload_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"文件大小超过限制（{settings.upload_max_size / 1024 / 1024:.0f}MB）"
+        )
+
+    try:
+        session = await run_io(_create_upload, path, request)
+    except HTTPException:
+        raise
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权限写入该目录")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建上传失败: {str(e)}")
+
+    return {**session.to_dict(), "chunk_size": settings.upload_chunk_size}
+
+
+def _create_upload(path: str, request: UploadInitRequest):
+    """init_upload 的阻塞部分（在文件 I/O 线程池中执行）"""
+    dir_path = os.path.dirname(path)
+    if dir_path and not os.path.isdir(dir_path):
+        raise HTTPException(status_code=400, detail="目录不存在")
+
+    if os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="目标路径是目录")
+
+    if not request.overwrite and os.path.exists(path):
+        raise HTTPException(status_code=409, detail="文件已存在")
+
+    return upload_manager.create(path, request.size, request.sha256, request.overwrite)
+
+
+@router.get("/upload/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """查询上传进度（断线重连后据此 offset 续传）"""
+    try:
+        return upload_manager.get(upload_id).to_dict()
+    except UploadError as e:
+        raise upload_error_to_http(e)
+
+
+@router.put("/upload/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="分块在文件中的起始偏移量"),
+    chunk_sha256: Optional[str] = Query(None, description="可选，本分块的 SHA-256")
+):
+    """
+    上传一个分块（请求体为原始字节，边接收边写盘）
+
+    - **offset**: 必须等于服务端已接收字节数，否则返回 409 和当前 offset
+    - **chunk_sha256**: 提供时校验本分块，失败返回 422 并回退
+
+    连接中断时，未提供分块校验和的已接收数据会保留，客户端查询进度后续传即可。
+    """
+    try:
+        writer = await run_io(upload_manager.open_chunk, upload_id, offset, chunk_sha256)
+    except UploadError as e:
+        raise upload_error_to_http(e)
+
+    try:
+        async for data in request.stream():
+            if data:
+                await run_io(writer.write, data)
+    except UploadError as e:
+        await run_io(writer.rollback)
+        raise upload_error_to_http(e)
+    except Exception as e:
+        await run_io(writer.rollback)
+        raise HTTPException(status_code=400, detail=f"分块接收中断: {str(e)}")
+
+    try:
+        session = await run_io(writer.commit)
+    except UploadError as e:
+        raise upload_error_to_http(e)
+
+    return session.to_dict()
+
+
+@router.post("/upload/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """完成上传：校验大小与 SHA-256 后原子重命名为目标文件"""
+    try:
+        session = await run_io(upload_manager.complete, upload_id)
+    except UploadError as e:
+        raise upload_error_to_http(e)
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="文件已存在")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权限写入该文件")
+
+    return {"success": True, "path": session.path, "size": session.size}
+
+
+@router.delete("/upload/{upload_id}")
+async def abort_upload(upload_id: str):
+    """取消上传并删除临时文件"""
+    try:
+        await run_io(upload_manager.abort, upload_id)
+    except UploadError as e:
+        raise upload_error_to_http(e)
+    return {"success": True}
+
+
+@router.post("/edit")
+async def edit_file(
+    http_request: Request,
+    path: str = Query(..., description="要编辑的文件路径"),
+    request: FileEditRequest = None
+):
+    """
+    按行区间补丁编辑文件（原子写入，带冲突检测）
+
+    - **edits**: `[{start_line, end_line, text}]`，用 text 替换 [start_line, end_line) 行
+    - **expected_mtime** / **expected_sha256**: 客户端读取时的版本，不一致返回 409
+
+    只需上传改动的行，服务端在原内容上应用后通过临时文件 + 重命名写回。
+    """
+    return await run_io(_edit_file, path, request, request=http_request)
+
+
+def _edit_file(path: str, request: FileEditRequest):
+    """edit_file 的阻塞实现（在文件 I/O 线程池中执行）"""
+    path = normalize_path(path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail="不是有效的文件")
+
+    try:
+        with open(path, 'rb') as f:
+            original = f.read()
+
+        check_write_conflict(path, request.expected_mtime, request.expected_sha256, original)
+
+        text = original.decode(request.encoding)
+        edits = [(e.start_line, e.end_line, e.text) for e in request.edits]
+        data = apply_line_edits(text, edits).encode(request.encoding)
+
+        # 写入前再确认一次，缩小与其他写入者的竞争窗口
+        check_write_conflict(path, request.expected_mtime, request.expected_sha256)
+        stat = atomic_write(path, data)
+
+        return {
+            "success": True,
+            "path": path,
+            "size": len(data),
+            "modified": stat.st_mtime,
+            "sha256": sha256_bytes(data)
+        }
+    except HTTPException:
+        raise
+    except (ValueError, LookupError) as e:
+        # 包含 UnicodeError 与未知编码
+        raise HTTPException(status_code=400, detail=f"无法应用编辑: {str(e)}")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权限写入该文件")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"编辑文件失败: {str(e)}")
+
+
+@router.get("/archive")
+async def download_archive(
+    path: str = Query(..., description="要打包的目录路径"),
+    format: str = Query("tar.gz", description="压缩格式: tar.gz / zip"),
+    include: Optional[List[str]] = Query(None, description="只包含匹配的文件 glob，可多次指定"),
+    exclude: Optional[List[str]] = Query(None, description="排除匹配的文件/目录 glob，可多次指定"),
+    show_hidden: bool = Query(True, description="是否包含隐藏文件"),
+    respect_gitignore: bool = Query(False, description="是否遵循 .gitignore 规则")
+):
+    """
+    将目录流式打包下载（边压缩边发送，不生成临时文件）
+
+    - **path**: 目录路径
+    - **format**: tar.gz 或 zip
+    - **include** / **exclude**: glob 过滤，含 `/` 时匹配相对路径
+    - **respect_gitignore**: 跳过 .gitignore 忽略的文件（如 node_modules）
+    """
+    path = normalize_path(path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    await run_io(_require_directory, path)
+
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的压缩格式: {format}")
+
+    def producer(emit, cancel_event):
+        write_archive(
+            path,
+            format,
+            emit,
+            cancel_event,
+            include=include,
+            exclude=exclude,
+            show_hidden=show_hidden,
+            respect_gitignore=respect_gitignore,
+        )
+
+    filename = f"{os.path.basename(path) or 'archive'}.{format}"
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"
+    }
+    return StreamingResponse(
+        iterate_in_thread(producer),
+        media_type=ARCHIVE_MEDIA_TYPES[format],
+        headers=headers
+    )
+
+
+@router.get("/thumbnail")
+async def get_thumbnail(
+    path: str = Query(..., description="图片路径"),
+    size: int = Query(256, ge=1, description="缩略图边长，会取不小于该值的固定尺寸")
+):
+    """
+    获取图片缩略图（直接返回图片字节，带磁盘缓存）
+
+    - **path**: 图片路径
+    - **size**: 期望边长，实际使用 128 / 256 / 512 中不小于该值的最小尺寸
+    """
+    path = normalize_path(path)
+
+    # 安全检查
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+
+    await run_io(_require_file, path)
+
+    if os.path.splitext(path)[1].lower() not in THUMBNAIL_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="不支持的图片格式")
+
+    if not pillow_available():
+        raise HTTPException(status_code=501, detail="服务器未安装 Pillow，无法生成缩略图")
+
+    size = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+
+    try:
+        content, media_type = await thumbnail_cache.get(path, size)
+    except ThumbnailUnavailable as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权限读取该文件")
+
+    # 缓存键包含源文件 mtime，源文件变化后会重新生成
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Cache-Control": "private, max-age=60"}
+    )
+
+
+@router.websocket("/watch")
+async def watch_files(websocket: WebSocket, token: str = Query(...)):
+    """
+    监听文件/目录变更（WebSocket，inotify 实现）
+
+    客户端消息:
+    - `{"type": "subscribe", "paths": [...]}` 添加监听（目录监听其直接子项）
+    - `{"type": "unsubscribe", "paths": [...]}` 取消监听
+
+    服务端推送去抖合并后的事件:
+    `{"type": "events", "events": [{"event": "create|modify|delete|move", "path": ..., "src": ...}]}`，
+    事件队列溢出时推送 `{"event": "overflow"}`，客户端应整体刷新。
+    """
+    user = await verify_token_async(token)
+    if not user:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+
+    await websocket.accept()
+
+    try:
+        session = WatchSession(
+            settings.fs_watch_max_per_connection,
+            debounce=settings.fs_watch_debounce_ms / 1000
+        )
+    except OSError as e:
+        await websocket.close(code=1011, reason=f"无法创建监听: {e}")
+        return
+
+    async def handle_messages():
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await websocket.send_json({"type": "error", "detail": "无效的 JSON 消息"})
+                continue
+            # 只处理 JSON 对象，其他合法 JSON（数组、数字等）忽略
+            if not isinstance(data, dict):
+                continue
+
+            msg_type = data.get("type")
+            paths = data.get("paths") or []
+            paths = [p for p in paths if isinstance(p, str)] if isinstance(paths, list) else []
+            if msg_type == "subscribe":
+                errors = {}
+                for raw_path in paths:
+                    path = normalize_path(raw_path)
+                    if not is_path_allowed(path):
+                        errors[raw_path] = "路径访问被拒绝"
+                        continue
+                    try:
+                        session.add(path)
+                    except WatchLimitExceeded as e:
+                        errors[raw_path] = str(e)
+                    except OSError as e:
+                        errors[raw_path] = f"无法监听: {e.strerror}"
+                await websocket.send_json({"type": "subscribed", "paths": session.paths, "errors": errors})
+            elif msg_type == "unsubscribe":
+                for raw_path in paths:
+                    session.remove(normalize_path(raw_path))
+                await websocket.send_json({"type": "subscribed", "paths": session.paths, "errors": {}})
+
+    async def push_events():
+        while True:
+            events = await session.get()
+            await websocket.send_json({"type": "events", "events": events})
+
+    tasks = [asyncio.create_task(handle_messages()), asyncio.create_task(push_events())]
+    try:
+        # 任一方向结束（客户端断开或发送失败）即关闭整个连接
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        session.close()
+        logger.info("文件监听连接结束")
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(http_request: Request, request: JobRequest):
+    """
+    提交后台文件任务，立即返回任务信息
+
+    - **type**: delete（递归删除）/ copy / move / archive（打包到 dest）/ du（统计占用）
+    - **path**: 源路径
+    - **dest**: copy / move / archive 的目标路径（不能已存在）
+    """
+    return await run_io(_submit_job, request, request=http_request)
+
+
+def _submit_job(request: JobRequest):
+    """submit_job 的阻塞实现（在文件 I/O 线程池中执行）"""
+    if request.type not in JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的任务类型: {request.type}")
+
+    path = normalize_path(request.path)
+    if not is_path_allowed(path):
+        raise HTTPException(status_code=403, detail="路径访问被拒绝")
+    if not os.path.lexists(path):
+        raise HTTPException(status_code=404, detail="路径不存在")
+
+    params = {"path": path}
+    if request.type in ("copy", "move", "archive"):
+        if not request.dest:
+            raise HTTPException(status_code=400, detail="缺少目标路径")
+        dest = normalize_path(request.dest)
+        if not is_path_allowed(dest):
+            raise HTTPException(status_code=403, detail="目标路径访问被拒绝")
+        if os.path.lexists(dest):
+            raise HTTPException(status_code=409, detail="目标路径已存在")
+        dest_dir = os.path.dirname(dest)
+        if dest_dir and not os.path.isdir(dest_dir):
+            raise HTTPException(status_code=400, detail="目标目录不存在")
+        if dest == path or dest.startswith(path + os.sep):
+            raise HTTPException(status_code=400, detail="目标路径不能位于源路径内")
+        params["dest"] = dest
+
+    if request.type in ("archive", "du") and not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="不是有效的目录")
+    if request.type == "archive":
+        if request.format not in ARCHIVE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的压缩格式: {request.format}")
+        params.update(format=request.format, exclude=request.exclude,
+                      respect_gitignore=request.respect_gitignore)
+
+    return job_manager.submit(request.type, params).to_dict()
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """列出后台任务（最近的在前）"""
+    return {"jobs": [job.to_dict() for job in job_manager.list()]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消后台任务（已完成的部分不会回滚）"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
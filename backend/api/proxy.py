@@ -1,24 +1,29 @@
 """
 反向代理 API - 将请求代理到本地端口
 """
+import asyncio
 import logging
 from typing import Optional
 from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 import httpx
 
-from services.auth import verify_token
+from services.auth import verify_token_async
+from services.proxy_client import proxy_client, UpstreamBusy
+from services.proxy_cache import proxy_cache, CacheEntry, parse_http_date
+from services.blocking_io import run_io
+from services.http_cache import is_not_modified
+from services.ws_relay import WebSocketRelay, connect_upstream, relay_stats
+from services.port_discovery import port_discovery
+from services.database import SessionLocal
+from models.task import Task
+from config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/proxy", tags=["代理"])
 
-# HTTP 客户端配置
-http_client = httpx.AsyncClient(
-    timeout=httpx.Timeout(30.0, connect=10.0),
-    follow_redirects=False,  # 不自动跟随重定向，我们自己处理
-)
-
 # 允许代理的端口范围（安全限制）
 ALLOWED_PORT_MIN = 1024  # 不允许特权端口
 ALLOWED_PORT_MAX = 65535
@@ -37,16 +42,69 @@ def validate_port(port: int) -> None:
         raise HTTPException(status_code=400, detail=f"端口号必须在 {ALLOWED_PORT_MIN}-{ALLOWED_PORT_MAX} 范围内")
 
 
+def _user_task_ports(user_id: int) -> list[dict]:
+    """当前用户运行中任务的监听端口（阻塞，应在线程池中调用）"""
+    db = SessionLocal()
+    try:
+        tasks = db.query(Task.id, Task.name, Task.tmux_session).filter(
+            Task.user_id == user_id,
+            Task.status == "running"
+        ).all()
+    finally:
+        db.close()
+    result = []
+    for task_id, name, tmux_session in tasks:
+        for item in port_discovery.session_ports(tmux_session):
+            result.append({**item, "task_id": task_id, "task_name": name})
+    return result
+
+
+async def check_task_port(port: int, user) -> bool:
+    """启用 proxy_restrict_to_task_ports 时，端口必须由当前用户的任务进程监听"""
+    if not settings.proxy_restrict_to_task_ports:
+        return True
+    ports = await run_io(_user_task_ports, user.id)
+    return any(item["port"] == port for item in ports)
+
+
 async def verify_token_dependency(token: Optional[str] = Query(None)) -> dict:
     """验证 token 的依赖项"""
     if not token:
         raise HTTPException(status_code=401, detail="缺少认证 token")
-    user = verify_token(token)
+    user = await verify_token_async(token)
     if not user:
         raise HTTPException(status_code=401, detail="无效的 token")
     return {"user": user}
 
 
+@router.get("/stats", summary="代理连接池统计")
+async def proxy_stats(
+    _: dict = Depends(verify_token_dependency)
+):
+    """返回连接池配置、当前连接数、各上游端口的并发统计、缓存统计及活动的 WebSocket 连接"""
+    stats = proxy_client.stats()
+    stats["cache"] = proxy_cache.stats()
+    stats["websockets"] = relay_stats()
+    return stats
+
+
+@router.get("/ports", summary="可代理的任务端口")
+async def list_task_ports(
+    auth: dict = Depends(verify_token_dependency)
+):
+    """列出当前用户运行中任务启动的服务所监听的端口"""
+    return {"ports": await run_io(_user_task_ports, auth["user"].id)}
+
+
+@router.delete("/cache", summary="清空代理缓存")
+async def clear_proxy_cache(
+    port: Optional[int] = Query(None, description="只清空该端口的缓存，为空时清空全部"),
+    _: dict = Depends(verify_token_dependency)
+):
+    """清空代理静态资源缓存"""
+    return {"removed": proxy_cache.clear(port)}
+
+
 @router.api_route(
     "/{port}/{path:path}",
     methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"],
@@ -56,7 +114,7 @@ async def proxy_http(
     port: int,
     path: str,
     request: Request,
-    _: dict = Depends(verify_token_dependency)
+    auth: dict = Depends(verify_token_dependency)
 ):
     """
     将 HTTP 请求代理到 localhost:port/path
@@ -64,6 +122,11 @@ async def proxy_http(
     用法: GET /proxy/8080/some/path?token=xxx
     """
     validate_port(port)
+    if not await check_task_port(port, auth["user"]):
+        raise HTTPException(status_code=403, detail=f"端口 {port} 不属于当前用户的任务")
+    # 没有服务监听时立即返回，不占用连接池和并发名额
+    if await run_io(port_discovery.is_listening, port) is False:
+        raise HTTPException(status_code=502, detail=f"本地端口 {port} 上没有正在监听的服务")
 
     # 构建目标 URL
     target_url = f"http://127.0.0.1:{port}/{path}"
@@ -83,19 +146,62 @@ async def proxy_http(
     # 修改 Host 头为目标服务器
     headers['host'] = f'127.0.0.1:{port}'
 
-    # 获取请求体
-    body = await request.body()
+    # 请求体流式转发，不在内存中缓存整个上传内容
+    has_body = 'transfer-encoding' in request.headers or \
+        request.headers.get('content-length', '0') != '0'
+    body_sent = asyncio.Event()
+    if has_body:
+        body = _track_body(request.stream(), body_sent)
+    else:
+        body = None
+        body_sent.set()
+
+    # 静态资源缓存：未过期的缓存直接返回，已过期的向上游发起条件请求
+    cacheable = proxy_cache.request_cacheable(request.method, request.headers)
+    cached = proxy_cache.lookup(port, target_url, request.headers) if cacheable else None
+    cached_body = None
+    if cached is not None:
+        cached_body = await run_io(proxy_cache.read_body, cached)
+        if cached_body is None:
+            # 已被淘汰
+            cached = None
+    if cached is not None:
+        if cached.is_fresh() and not proxy_cache.wants_revalidation(request.headers):
+            proxy_cache.record_hit(cached, revalidated=False)
+            return _cached_response(cached, cached_body, request, "HIT")
+        for key in [k for k in headers if k.lower() in ('if-none-match', 'if-modified-since')]:
+            del headers[key]
+        if cached.etag:
+            headers['if-none-match'] = cached.etag
+        if cached.last_modified:
+            headers['if-modified-since'] = cached.last_modified
 
     logger.info(f"代理请求: {request.method} {target_url}")
 
+    # 每个上游端口单独限流，卡住的端口不会占满连接池
     try:
-        # 发送请求到目标服务器
-        response = await http_client.request(
+        limiter = await proxy_client.acquire(port)
+    except UpstreamBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    handed_off = False
+    released = False
+    try:
+        # 发送请求到目标服务器，只等待响应头，响应体随后流式读取
+        upstream_request = proxy_client.http.build_request(
             method=request.method,
             url=target_url,
             headers=headers,
             content=body,
         )
+        response = await _send_upstream(upstream_request, body_sent)
+
+        if cached is not None and response.status_code == 304:
+            # 缓存仍然有效，只更新新鲜期
+            await response.aclose()
+            proxy_cache.refresh(cached, response.headers)
+            proxy_cache.record_hit(cached, revalidated=True)
+            return _cached_response(cached, cached_body, request, "REVALIDATED")
 
         # 准备响应头（排除 hop-by-hop 头）
         response_headers = {}
@@ -121,22 +227,112 @@ async def proxy_http(
                 token = request.query_params.get('token', '')
                 response_headers['location'] = f"/proxy/{port}{new_path}?token={token}"
 
-        return Response(
-            content=response.content,
+        if response.headers.get('content-type', '').startswith('text/event-stream'):
+            # 避免前置的反向代理缓冲 SSE
+            response_headers['x-accel-buffering'] = 'no'
+            # SSE 连接会一直保持，收到响应头后就释放并发名额，避免长连接占满该端口的名额
+            proxy_client.release(port)
+            released = True
+
+        async def close_upstream():
+            await response.aclose()
+            if not released:
+                proxy_client.release(port)
+
+        # 原样转发响应体字节（不解压），Content-Encoding / Content-Length 保持一致；
+        # 并发名额在响应体转发完毕（或客户端断开）后释放
+        store = None
+        if cacheable and proxy_cache.storable(response.status_code, response.headers, request.headers):
+            async def store(content: bytes):
+                await run_io(proxy_cache.store, port, target_url, request.headers,
+                             response.headers, content)
+
+        streaming_response = StreamingResponse(
+            _iter_upstream(response, target_url, store),
             status_code=response.status_code,
             headers=response_headers,
-            media_type=response.headers.get('content-type')
+            background=BackgroundTask(close_upstream)
         )
+        handed_off = True
+        return streaming_response
 
     except httpx.ConnectError:
+        limiter.errors += 1
         logger.warning(f"无法连接到目标服务: {target_url}")
         raise HTTPException(status_code=502, detail=f"无法连接到本地端口 {port}")
-    except httpx.TimeoutException:
+    except (httpx.TimeoutException, asyncio.TimeoutError):
+        limiter.errors += 1
         logger.warning(f"连接超时: {target_url}")
         raise HTTPException(status_code=504, detail="连接超时")
     except Exception as e:
+        limiter.errors += 1
         logger.error(f"代理请求失败: {e}")
         raise HTTPException(status_code=500, detail=f"代理请求失败: {str(e)}")
+    finally:
+        if not handed_off and not released:
+            proxy_client.release(port)
+
+
+async def _track_body(stream, body_sent: asyncio.Event):
+    """转发请求体，发送完毕后置位 body_sent"""
+    async for chunk in stream:
+        yield chunk
+    body_sent.set()
+
+
+async def _send_upstream(upstream_request: httpx.Request, body_sent: asyncio.Event) -> httpx.Response:
+    """
+    发送请求并等待响应头
+
+    请求体上传阶段不限总时长（每次写入受 httpx 的 write 超时限制），
+    请求体发送完毕后才开始按 response_timeout 计时等待响应头
+    """
+    send = asyncio.ensure_future(proxy_client.http.send(upstream_request, stream=True))
+    waiter = asyncio.ensure_future(body_sent.wait())
+    try:
+        await asyncio.wait({send, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        send.cancel()
+        raise
+    finally:
+        waiter.cancel()
+    return await asyncio.wait_for(send, timeout=proxy_client.response_timeout)
+
+
+async def _iter_upstream(response: httpx.Response, target_url: str, store=None):
+    """
+    逐块读取上游响应体；上游中途断开时结束响应而不是抛出异常
+
+    提供 store 时同时收集响应体，完整读取且未超过缓存上限时交给 store 保存
+    """
+    chunks = [] if store is not None else None
+    size = 0
+    try:
+        async for chunk in response.aiter_raw():
+            if chunks is not None:
+                size += len(chunk)
+                if size <= proxy_cache.max_object_bytes:
+                    chunks.append(chunk)
+                else:
+                    chunks = None
+            yield chunk
+    except httpx.HTTPError as e:
+        logger.warning(f"上游响应中断: {target_url}: {e}")
+        return
+    if chunks is not None:
+        await store(b"".join(chunks))
+
+
+def _cached_response(entry: CacheEntry, body: bytes, request: Request, state: str) -> Response:
+    """由缓存项生成响应；客户端自身的缓存仍然有效时返回 304"""
+    headers = dict(entry.headers)
+    headers['x-proxy-cache'] = state
+    validator = entry.etag or ''
+    if is_not_modified(request.headers, validator, parse_http_date(entry.last_modified)):
+        for name in ('content-length', 'content-type', 'content-encoding'):
+            headers.pop(name, None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=200, headers=headers)
 
 
 @router.websocket("/ws/{port}/{path:path}")
@@ -154,12 +350,13 @@ async def proxy_websocket(
     validate_port(port)
 
     # 验证 token
-    user = verify_token(token)
+    user = await verify_token_async(token)
     if not user:
         await websocket.close(code=4001, reason="无效的 token")
         return
-
-    await websocket.accept()
+    if not await check_task_port(port, user):
+        await websocket.close(code=4003, reason=f"端口 {port} 不属于当前用户的任务")
+        return
 
     # 构建目标 WebSocket URL
     target_url = f"ws://127.0.0.1:{port}/{path}"
@@ -172,56 +369,18 @@ async def proxy_websocket(
 
     logger.info(f"代理 WebSocket: {target_url}")
 
-    # 使用 httpx 的 WebSocket 客户端（如果支持）或使用 websockets 库
+    # 先连接上游，再以上游选定的子协议接受客户端连接
     try:
-        import websockets
-    except ImportError:
-        await websocket.close(code=1011, reason="服务器缺少 websockets 库")
+        upstream = await connect_upstream(target_url, websocket)
+    except Exception as e:
+        logger.warning(f"无法连接到目标 WebSocket: {target_url}: {e}")
+        await websocket.accept()
+        await websocket.close(code=1011, reason=f"无法连接到本地端口 {port}")
         return
 
-    try:
-        async with websockets.connect(target_url) as target_ws:
-            logger.info(f"WebSocket 已连接到: {target_url}")
-
-            async def forward_to_target():
-                """从客户端转发消息到目标"""
-                try:
-                    while True:
-                        data = await websocket.receive()
-                        if 'text' in data:
-                            await target_ws.send(data['text'])
-                        elif 'bytes' in data:
-                            await target_ws.send(data['bytes'])
-                except WebSocketDisconnect:
-                    pass
-                except Exception as e:
-                    logger.debug(f"forward_to_target 结束: {e}")
-
-            async def forward_to_client():
-                """从目标转发消息到客户端"""
-                try:
-                    async for message in target_ws:
-                        if isinstance(message, str):
-                            await websocket.send_text(message)
-                        else:
-                            await websocket.send_bytes(message)
-                except Exception as e:
-                    logger.debug(f"forward_to_client 结束: {e}")
-
-            # 并行运行两个转发任务
-            import asyncio
-            await asyncio.gather(
-                forward_to_target(),
-                forward_to_client(),
-                return_exceptions=True
-            )
-
-    except ConnectionRefusedError:
-        logger.warning(f"无法连接到目标 WebSocket: {target_url}")
-        await websocket.close(code=502, reason=f"无法连接到本地端口 {port}")
-    except Exception as e:
-        logger.error(f"WebSocket 代理错误: {e}")
-        await websocket.close(code=1011, reason=str(e))
+    await websocket.accept(subprotocol=upstream.subprotocol)
+    logger.info(f"WebSocket 已连接到: {target_url}")
+    await WebSocketRelay(websocket, upstream, port, path).run()
 
 
 @router.get("/", summary="代理入口页面")
@@ -233,7 +392,8 @@ async def proxy_index(
         "message": "Claude Remote 反向代理",
         "usage": {
             "http": "/proxy/{port}/{path}?token=xxx",
-            "websocket": "/proxy/ws/{port}/{path}?token=xxx"
+            "websocket": "/proxy/ws/{port}/{path}?token=xxx",
+            "ports": "/proxy/ports?token=xxx"
         },
         "example": "/proxy/8080/index.html?token=xxx"
     }
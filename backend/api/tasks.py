@@ -1,15 +1,27 @@
 """
 任务管理 API
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import String, and_, func, or_, select, type_coerce, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+import base64
+import json
+import operator
 import uuid
 import os
 
-from services.database import get_db
+from services.database import engine, get_async_db
 from services.auth import get_current_active_user
+from services.job_service import job_manager
+from services.blocking_io import run_io
+from services.fs_walker import iterate_in_thread
+from services.git_service import git_service, GitError, NotAGitRepository, normalize_repo_path
+from services.port_discovery import port_discovery
+from services.http_cache import digest_etag, is_not_modified, cache_headers
 from services.terminal_service import SHORTCUT_KEYS, validate_tmux_key, SPECIAL_KEY_TO_RAW
 from models.user import User
 from models.task import Task
@@ -53,29 +65,163 @@ class TaskDetail(TaskResponse):
     teammate_mode: bool = False
 
 
+# 任务列表只需要这些列
+_TASK_LIST_COLUMNS = (
+    Task.id, Task.name, Task.tmux_session, Task.work_dir,
+    Task.status, Task.skip_permissions, Task.teammate_mode,
+)
+
+# 任务列表可用的排序字段
+_TASK_SORT_COLUMNS = {
+    "created_at": Task.created_at,
+    "name": Task.name,
+    "status": Task.status,
+}
+
+TASK_PAGE_MAX = 500
+
+
+def _sort_expression(sort: str):
+    """排序与游标比较使用的表达式"""
+    column = _TASK_SORT_COLUMNS[sort]
+    if sort == "created_at" and engine.dialect.name == "sqlite":
+        # SQLite 中按存储的文本比较，避免 datetime 绑定参数带微秒造成的精度差异
+        return type_coerce(column, String)
+    return column
+
+
+def _encode_cursor(task_id: int, value, sort: str, order: str) -> str:
+    """游标保存上一页最后一个任务的排序值与 id，该任务之后被删除也能继续翻页"""
+    data = {"id": task_id, "sort": sort, "order": order, "value": value}
+    if isinstance(value, datetime):
+        data.update(value=value.isoformat(), datetime=True)
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str, order: str) -> tuple:
+    """解析分页游标，返回上一页最后一个任务的 (排序值, id)"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        task_id = int(data["id"])
+        value = data["value"]
+        if data.get("datetime"):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    if data.get("sort") != sort or data.get("order") != order:
+        raise HTTPException(status_code=400, detail="分页游标与排序参数不一致")
+    return value, task_id
+
+
+def _created_at_condition(op, value: datetime):
+    """
+    创建时间过滤条件，不带时区的参数按 UTC 处理
+
+    SQLite 中 created_at 为 CURRENT_TIMESTAMP 写入的文本（UTC，精确到秒），
+    直接绑定 datetime 会带上微秒导致边界比较出错，因此按相同格式的文本比较（仍可使用索引）
+    """
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if engine.dialect.name != "sqlite":
+        return op(Task.created_at, value)
+    if value.microsecond:
+        # 存储精度为秒，向上取整后 >= 与 < 的语义保持不变
+        value = value.replace(microsecond=0) + timedelta(seconds=1)
+    return op(type_coerce(Task.created_at, String), value.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+async def _mark_ended_tasks(db: AsyncSession, user_id: int):
+    """把 tmux 会话已不存在的运行中任务标记为已停止（一次列出所有会话，不逐个检查）"""
+    running = (await db.execute(
+        select(Task.id, Task.tmux_session)
+        .where(Task.user_id == user_id, Task.status == "running")
+    )).all()
+    if not running:
+        return
+    terminal = get_terminal_service()
+    alive = await run_io(terminal.session_names)
+    ended = [task_id for task_id, tmux_session in running if tmux_session not in alive]
+    if ended:
+        await db.execute(update(Task).where(Task.id.in_(ended)).values(status="stopped"))
+        await db.commit()
+
+
 @router.get("", response_model=list[TaskResponse])
 async def get_tasks(
-    db: Session = Depends(get_db),
+    http_request: Request,
+    status_filter: Optional[str] = Query(None, alias="status", description="按状态过滤，多个用逗号分隔"),
+    work_dir: Optional[str] = Query(None, description="按工作目录前缀过滤"),
+    created_after: Optional[datetime] = Query(None, description="只返回此时间（含）之后创建的任务"),
+    created_before: Optional[datetime] = Query(None, description="只返回此时间之前创建的任务"),
+    sort: str = Query("created_at", pattern="^(created_at|name|status)$", description="排序字段"),
+    order: str = Query("asc", pattern="^(asc|desc)$", description="排序方向"),
+    limit: Optional[int] = Query(None, ge=1, le=TASK_PAGE_MAX, description="每页条数，为空时返回全部"),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """获取任务列表"""
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).all()
-
-    # 更新实际状态
-    terminal = get_terminal_service()
-    for task in tasks:
-        if not terminal.session_exists(task.tmux_session):
-            if task.status == "running":
-                task.status = "stopped"
-    db.commit()
+    """
+    获取任务列表
 
-    return tasks
+    响应体为任务数组；X-Total-Count 为满足过滤条件的任务总数，
+    还有下一页时 X-Next-Cursor 给出下一页的游标。
+    列表未变化时按 If-None-Match 返回 304
+    """
+    await _mark_ended_tasks(db, current_user.id)
+
+    conditions = [Task.user_id == current_user.id]
+    if status_filter:
+        conditions.append(Task.status.in_([s.strip() for s in status_filter.split(",") if s.strip()]))
+    if work_dir:
+        conditions.append(Task.work_dir.startswith(work_dir, autoescape=True))
+    if created_after is not None:
+        conditions.append(_created_at_condition(operator.ge, created_after))
+    if created_before is not None:
+        conditions.append(_created_at_condition(operator.lt, created_before))
+
+    total = await db.scalar(select(func.count()).select_from(Task).where(*conditions))
+
+    sort_column = _sort_expression(sort)
+    descending = order == "desc"
+    query = select(*_TASK_LIST_COLUMNS, sort_column.label("sort_value")).where(*conditions)
+    if cursor:
+        last_value, last_id = _decode_cursor(cursor, sort, order)
+        if descending:
+            query = query.where(or_(sort_column < last_value,
+                                    and_(sort_column == last_value, Task.id < last_id)))
+        else:
+            query = query.where(or_(sort_column > last_value,
+                                    and_(sort_column == last_value, Task.id > last_id)))
+    if descending:
+        query = query.order_by(sort_column.desc(), Task.id.desc())
+    else:
+        query = query.order_by(sort_column, Task.id)
+    if limit is not None:
+        # 多取一条判断是否还有下一页
+        query = query.limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].id, rows[-1].sort_value, sort, order)
+    tasks = [TaskResponse.model_validate(row._mapping).model_dump() for row in rows]
+
+    headers = {"X-Total-Count": str(total)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    etag = digest_etag([total, next_cursor, *(tuple(task.values()) for task in tasks)])
+    if is_not_modified(http_request.headers, etag):
+        return Response(status_code=304, headers={**cache_headers(etag), **headers})
+    return JSONResponse(tasks, headers={**cache_headers(etag), **headers})
 
 
 @router.post("", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
 async def create_task(
     task_data: TaskCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """新建任务"""
@@ -116,8 +262,8 @@ async def create_task(
         user_id=current_user.id
     )
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    await db.commit()
+    await db.refresh(task)
 
     return task
 
@@ -125,14 +271,14 @@ async def create_task(
 @router.get("/{task_id}", response_model=TaskDetail)
 async def get_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """获取任务详情"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -157,14 +303,14 @@ async def get_task(
 async def update_task(
     task_id: int,
     task_data: TaskUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """更新任务设置"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -177,8 +323,8 @@ async def update_task(
     if task_data.teammate_mode is not None:
         task.teammate_mode = task_data.teammate_mode
 
-    db.commit()
-    db.refresh(task)
+    await db.commit()
+    await db.refresh(task)
 
     return task
 
@@ -187,14 +333,14 @@ async def update_task(
 async def send_input(
     task_id: int,
     input_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """向任务发送输入"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -207,7 +353,7 @@ async def send_input(
         if not success:
             raise HTTPException(status_code=400, detail="会话已结束且无法恢复")
         task.status = "running"
-        db.commit()
+        await db.commit()
 
     command = input_data.get("command", "")
     if not command:
@@ -223,14 +369,14 @@ async def send_input(
 @router.post("/{task_id}/restore")
 async def restore_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """恢复已停止的任务"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -262,7 +408,7 @@ async def restore_task(
         raise HTTPException(status_code=500, detail="恢复会话失败")
 
     task.status = "running"
-    db.commit()
+    await db.commit()
 
     return {"message": "任务已恢复"}
 
@@ -270,14 +416,14 @@ async def restore_task(
 @router.post("/{task_id}/stop")
 async def stop_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """终止会话（保留数据库记录，可恢复）"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -288,7 +434,7 @@ async def stop_task(
 
     # 更新状态为已停止
     task.status = "stopped"
-    db.commit()
+    await db.commit()
 
     return {"message": "任务已终止"}
 
@@ -297,16 +443,14 @@ async def stop_task(
 async def delete_task(
     task_id: int,
     delete_files: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """删除任务（可选删除工作目录）"""
-    import shutil
-
-    task = db.query(Task).filter(
+    """删除任务（可选删除工作目录，目录在后台任务中删除）"""
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -318,17 +462,15 @@ async def delete_task(
     work_dir = task.work_dir
 
     # 从数据库删除
-    db.delete(task)
-    db.commit()
+    await db.delete(task)
+    await db.commit()
 
-    # 可选：删除工作目录
+    # 可选：删除工作目录（后台执行，避免大目录阻塞请求）
     if delete_files and work_dir:
-        try:
-            expanded_dir = os.path.expanduser(work_dir)
-            if os.path.exists(expanded_dir):
-                shutil.rmtree(expanded_dir)
-        except Exception as e:
-            print(f"删除目录失败: {e}")
+        expanded_dir = os.path.expanduser(work_dir)
+        if await run_io(os.path.isdir, expanded_dir):
+            job = job_manager.submit("delete", {"path": expanded_dir})
+            return {"message": "任务已删除", "job_id": job.id}
 
     return {"message": "任务已删除"}
 
@@ -337,7 +479,7 @@ async def delete_task(
 async def send_shortcut(
     task_id: int,
     shortcut_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """发送快捷键
@@ -346,10 +488,10 @@ async def send_shortcut(
     1. 预定义快捷键: { "key": "ctrl_c" } - 使用 SHORTCUT_KEYS 映射
     2. tmux 格式: { "key": "C-c", "isTmuxFormat": true } - 直接使用 tmux 格式
     """
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -399,14 +541,14 @@ async def send_shortcut(
 async def send_raw_input(
     task_id: int,
     input_data: RawInput,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """发送原始输入（用于终端模拟器）"""
-    task = db.query(Task).filter(
+    task = await db.scalar(select(Task).where(
         Task.id == task_id,
         Task.user_id == current_user.id
-    ).first()
+    ))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -422,6 +564,108 @@ async def send_raw_input(
     return {"message": "输入已发送"}
 
 
+def _git_error_to_http(e: GitError) -> HTTPException:
+    """将 git 服务错误转换为 HTTP 错误"""
+    if isinstance(e, NotAGitRepository):
+        return HTTPException(status_code=404, detail=str(e))
+    return HTTPException(status_code=500, detail=f"git 命令执行失败: {e}")
+
+
+@router.get("/{task_id}/git/status")
+async def get_git_status(
+    task_id: int,
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取任务工作目录的 git 状态
+
+    files 中每项的 index / worktree 为暂存区 / 工作区状态码（'.' 表示未变化），
+    kind 为 modified / renamed / unmerged / untracked
+    """
+    task = await db.scalar(select(Task).where(
+        Task.id == task_id,
+        Task.user_id == current_user.id
+    ))
+
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    work_dir = os.path.expanduser(task.work_dir)
+    try:
+        return await run_io(git_service.status, work_dir, request=http_request)
+    except GitError as e:
+        raise _git_error_to_http(e)
+
+
+@router.get("/{task_id}/git/diff")
+async def get_git_diff(
+    task_id: int,
+    http_request: Request,
+    path: Optional[str] = Query(None, description="相对仓库根目录的文件路径，为空时返回全部变更"),
+    staged: bool = Query(False, description="是否查看已暂存的变更"),
+    context: int = Query(3, ge=0, le=100, description="上下文行数"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取任务工作目录的 diff（统一 diff 格式）
+
+    较大的变更集以流式返回；未跟踪文件指定 path 时显示为新增文件。
+    流式输出过程中 git 失败时，输出末尾追加以 "### git diff failed: " 开头的错误行
+    """
+    task = await db.scalar(select(Task).where(
+        Task.id == task_id,
+        Task.user_id == current_user.id
+    ))
+
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    try:
+        path = normalize_repo_path(path) if path else ""
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    work_dir = os.path.expanduser(task.work_dir)
+    media_type = "text/x-diff"
+    try:
+        cached = await run_io(git_service.cached_diff, work_dir, path, staged, context,
+                              request=http_request)
+    except GitError as e:
+        raise _git_error_to_http(e)
+    if cached is not None:
+        return Response(content=cached, media_type=media_type)
+
+    producer = git_service.diff_producer(work_dir, path, staged, context)
+    return StreamingResponse(iterate_in_thread(producer), media_type=media_type)
+
+
+@router.get("/{task_id}/ports")
+async def get_task_ports(
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取任务启动的服务所监听的 TCP 端口
+
+    在 tmux 会话的进程树中查找；proxyable 表示可以通过 /proxy/{port}/ 访问
+    （监听在回环地址或全部地址上）
+    """
+    task = await db.scalar(select(Task).where(
+        Task.id == task_id,
+        Task.user_id == current_user.id
+    ))
+
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    ports = await run_io(port_discovery.session_ports, task.tmux_session)
+    return {"task_id": task.id, "ports": ports}
+
+
 @router.get("/shortcuts/list")
 async def list_shortcuts():
     """获取可用快捷键列表"""
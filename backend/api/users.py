@@ -3,11 +3,12 @@
 """
 import json
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, Any
 
-from services.database import get_db
+from services.database import get_async_db
 from services.auth import get_password_hash, get_current_active_user
 from models.user import User
 from models.user_config import UserConfig
@@ -32,12 +33,12 @@ class ConfigUpdate(BaseModel):
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """创建用户（需要已登录）"""
     # 检查用户名是否已存在
-    existing = db.query(User).filter(User.username == user_data.username).first()
+    existing = await db.scalar(select(User).where(User.username == user_data.username))
     if existing:
         raise HTTPException(status_code=400, detail="用户名已存在")
 
@@ -47,7 +48,7 @@ async def create_user(
         hashed_password=get_password_hash(user_data.password)
     )
     db.add(user)
-    db.commit()
+    await db.commit()
 
     return {"message": "用户创建成功"}
 
@@ -55,26 +56,32 @@ async def create_user(
 @router.post("/change-password")
 async def change_password(
     password_data: PasswordChange,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """修改密码"""
-    from services.auth import verify_password
+    from services.auth import verify_password, token_cache
 
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    # current_user 可能来自 token 缓存，需从当前会话重新加载后再修改
+    user = await db.scalar(select(User).where(User.id == current_user.id))
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+
+    if not verify_password(password_data.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="原密码错误")
 
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    db.commit()
+    user.hashed_password = get_password_hash(password_data.new_password)
+    await db.commit()
+    token_cache.invalidate_user(user.username)
 
     return {"message": "密码修改成功"}
 
 
 @router.post("/init")
-async def init_admin(db: Session = Depends(get_db)):
+async def init_admin(db: AsyncSession = Depends(get_async_db)):
     """初始化管理员账号（仅首次使用）"""
     # 检查是否已有用户
-    existing = db.query(User).first()
+    existing = await db.scalar(select(User).limit(1))
     if existing:
         raise HTTPException(status_code=400, detail="已存在用户，无法初始化")
 
@@ -84,7 +91,7 @@ async def init_admin(db: Session = Depends(get_db)):
         hashed_password=get_password_hash("admin123")
     )
     db.add(admin)
-    db.commit()
+    await db.commit()
 
     return {
         "message": "管理员账号创建成功",
@@ -95,11 +102,11 @@ async def init_admin(db: Session = Depends(get_db)):
 
 @router.get("/config")
 async def get_user_config(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """获取用户配置"""
-    config = db.query(UserConfig).filter(UserConfig.user_id == current_user.id).first()
+    config = await db.scalar(select(UserConfig).where(UserConfig.user_id == current_user.id))
     if config and config.shortcuts_json:
         try:
             return {"shortcuts": json.loads(config.shortcuts_json)}
@@ -111,11 +118,11 @@ async def get_user_config(
 @router.post("/config")
 async def save_user_config(
     data: ConfigUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """保存用户配置"""
-    config = db.query(UserConfig).filter(UserConfig.user_id == current_user.id).first()
+    config = await db.scalar(select(UserConfig).where(UserConfig.user_id == current_user.id))
     shortcuts_json = json.dumps(data.shortcuts) if data.shortcuts else None
 
     if config:
@@ -126,5 +133,5 @@ async def save_user_config(
             shortcuts_json=shortcuts_json
         )
         db.add(config)
-    db.commit()
+    await db.commit()
     return {"message": "配置已保存"}
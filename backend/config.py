@@ -15,6 +15,8 @@ class Settings(BaseSettings):
     secret_key: str = os.urandom(32).hex()
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60 * 24 * 7  # 7天
+    auth_cache_ttl: float = 30.0  # 已验证 token 的缓存时长（秒），0 表示不缓存
+    auth_cache_max_entries: int = 1024  # 缓存的 token 数上限
 
     # 登录安全配置
     login_max_attempts: int = 5  # 最大登录尝试次数
@@ -22,6 +24,10 @@ class Settings(BaseSettings):
 
     # 数据库配置
     database_url: str = "sqlite:///./claude_remote.db"
+    db_pool_size: int = 8  # 连接池常驻连接数
+    db_max_overflow: int = 16  # 并发高峰时允许额外创建的连接数
+    sqlite_busy_timeout_ms: int = 5000  # 写锁被占用时的等待时长
+    sqlite_mmap_size_mb: int = 64  # 内存映射读取的数据库大小上限，0 表示关闭
 
     # tmux 配置
     tmux_session_prefix: str = "claude_"
@@ -32,6 +38,82 @@ class Settings(BaseSettings):
     # CORS 配置（生产环境应设置具体域名，用逗号分隔）
     cors_origins: str = "*"  # 默认允许所有，生产环境应设置为具体域名
 
+    # 反向代理客户端配置
+    proxy_max_connections: int = 100  # 连接池总连接数上限
+    proxy_max_keepalive_connections: int = 20  # 保持空闲的连接数上限
+    proxy_keepalive_expiry: float = 30.0  # 空闲连接保留时长（秒）
+    proxy_connect_timeout: float = 10.0  # 连接上游超时
+    proxy_write_timeout: float = 30.0  # 发送请求体超时
+    proxy_pool_timeout: float = 10.0  # 等待连接池空闲连接超时
+    proxy_response_timeout: float = 30.0  # 请求体发送完毕后等待响应头的超时（上传与响应体不限时）
+    proxy_max_concurrency_per_port: int = 32  # 单个上游端口的并发请求上限
+    proxy_queue_timeout: float = 10.0  # 达到并发上限后排队等待的时长，超时返回 503
+    proxy_ws_max_message_mb: int = 16  # 代理 WebSocket 单条消息大小上限
+    proxy_ws_max_queue: int = 32  # 上游未转发消息的缓冲条数
+    proxy_ws_ping_interval: float = 20.0  # 上游 WebSocket 保活 ping 间隔
+    proxy_ws_ping_timeout: float = 20.0  # 等待 pong 超时，超时视为上游断开
+    proxy_ws_close_timeout: float = 5.0  # 关闭握手等待时长
+    proxy_restrict_to_task_ports: bool = False  # 只允许代理当前用户任务进程监听的端口
+
+    # 任务监听端口发现（读取 /proc）
+    port_discovery_ttl: float = 2.0  # 进程树与监听端口快照的缓存时长（秒）
+
+    # 反向代理静态资源缓存（默认关闭）
+    proxy_cache_enabled: bool = False
+    proxy_cache_memory_mb: int = 64  # 内存缓存容量
+    proxy_cache_disk_mb: int = 512  # 磁盘缓存容量，0 表示只用内存
+    proxy_cache_dir: str = "~/.cache/claude_remote/proxy"
+    proxy_cache_max_object_mb: int = 16  # 超过该大小的响应不缓存
+
+    # 响应压缩配置（brotli / zstandard 为可选依赖，未安装时只用 gzip）
+    compression_enabled: bool = True
+    compression_min_size: int = 1024  # 小于该字节数的响应不压缩
+    compression_content_types: str = (
+        "text/,application/json,application/javascript,application/x-javascript,"
+        "application/x-ndjson,application/xml,application/manifest+json,"
+        "application/wasm,image/svg+xml"
+    )  # 允许压缩的内容类型（前缀匹配，逗号分隔）
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+
+    # 文件 I/O 线程池大小（阻塞的文件操作在线程池中执行，不占用事件循环）
+    file_io_workers: int = 16
+    # 后台文件任务（递归删除、复制、打包等）的工作线程数
+    job_workers: int = 4
+
+    # 文件搜索配置
+    file_search_workers: int = 8  # 并行遍历目录的线程数
+    file_walk_threads: int = 32  # 所有并发遍历共享的线程数上限
+    file_stream_workers: int = 16  # 同时执行的流式搜索、打包、diff 数上限，超出的请求排队
+    file_search_max_results: int = 10000  # 单次搜索结果数上限
+    file_search_max_seconds: float = 60.0  # 单次搜索耗时上限（秒）
+    file_grep_max_file_size: int = 50 * 1024 * 1024  # 内容搜索跳过超过该大小的文件
+
+    # 分块上传配置
+    upload_max_size: int = 4 * 1024 * 1024 * 1024  # 单文件上传上限（4GB）
+    upload_chunk_size: int = 4 * 1024 * 1024  # 建议的分块大小
+    upload_expire_hours: int = 24  # 无进展的上传会话保留时长
+
+    # 缩略图配置（需要安装 Pillow）
+    thumbnail_cache_dir: str = "~/.cache/claude_remote/thumbnails"
+    thumbnail_cache_max_mb: int = 256  # 缩略图缓存容量上限
+    thumbnail_workers: int = 2  # 生成缩略图的进程数
+
+    # 目录占用统计配置
+    du_cache_file: str = "~/.cache/claude_remote/du_cache.json"  # 按目录 mtime 持久化的统计缓存
+    du_workers: int = 8  # 并行扫描目录的线程数
+    du_cache_save_interval: float = 30.0  # 统计缓存写入磁盘的最短间隔（秒），0 表示每次统计后立即写入
+
+    # 文件变更监听配置
+    fs_watch_max_per_connection: int = 64  # 单个 WebSocket 连接最多监听的路径数
+    fs_watch_debounce_ms: int = 200  # 事件合并窗口
+
+    # 工作目录 git 状态配置
+    git_command_timeout: float = 30.0  # 单条 git 命令超时（秒）
+    git_cache_ttl: float = 5.0  # 缓存最长有效期，覆盖索引/HEAD 未变但工作区文件被修改的情况
+    git_diff_cache_max_kb: int = 1024  # 超过该大小的 diff 只流式返回，不缓存
+
     class Config:
         env_file = ".env"
 
@@ -8,12 +8,21 @@ import json
 import logging
 import queue
 
+from sqlalchemy import select
+
 from api import auth, tasks, users, files, proxy
-from services.database import create_tables, SessionLocal
+from services.database import create_tables, engine, async_engine, AsyncSessionLocal
+from services.migrations import run_migrations
 from services.terminal_service import SHORTCUT_KEYS
 from models.task import Task
 from models.user import User
-from services.auth import verify_token
+from services.auth import verify_token_async
+from services.thumbnail_service import thumbnail_cache
+from services import blocking_io, fs_walker
+from services.job_service import job_manager
+from services.du_service import du_cache
+from services.proxy_client import proxy_client
+from services.compression import CompressionMiddleware
 from platform_utils import get_terminal_service
 from config import settings
 
@@ -31,8 +40,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 启动时创建数据库表
+# 启动时创建数据库表，并为已有数据库补上后续新增的索引等结构
 create_tables()
+run_migrations(engine)
 
 # CORS 配置（从配置文件读取）
 app.add_middleware(
@@ -41,8 +51,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Cursor"],
 )
 
+# 响应压缩（API 与反向代理共用；已压缩的上游响应原样透传）
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        content_types=settings.compression_content_types.split(","),
+    )
+
 # 注册路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
 app.include_router(tasks.router, prefix="/api/tasks", tags=["任务"])
@@ -51,6 +70,18 @@ app.include_router(files.router, prefix="/api/files", tags=["文件"])
 app.include_router(proxy.router, tags=["代理"])
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """关闭后台进程池、代理连接池、数据库连接池等资源"""
+    thumbnail_cache.shutdown()
+    blocking_io.shutdown()
+    fs_walker.shutdown()
+    job_manager.shutdown()
+    du_cache.shutdown()
+    await proxy_client.close()
+    await async_engine.dispose()
+
+
 @app.get("/")
 async def root():
     return {"message": "Claude Remote API", "version": "1.0.0"}
@@ -92,15 +123,17 @@ async def websocket_terminal(websocket: WebSocket, task_id: str):
         await websocket.close(code=4001, reason="Missing token")
         return
 
-    user = verify_token(token)
+    user = await verify_token_async(token)
     if not user:
         await websocket.close(code=4001, reason="Invalid token")
         return
 
-    db = SessionLocal()
+    # 查询完成后立即归还连接，不在整个 WebSocket 生命周期内占用
+    async with AsyncSessionLocal() as db:
+        task = await db.scalar(select(Task).where(Task.id == task_id_int))
+
     session_name = None
     try:
-        task = db.query(Task).filter(Task.id == task_id_int).first()
         if not task:
             logger.warning(f"Task {task_id} not found")
             await websocket.close()
@@ -197,4 +230,3 @@ async def websocket_terminal(websocket: WebSocket, task_id: str):
     finally:
         if session_name and session_name in active_websockets:
             active_websockets[session_name].discard(websocket)
-        db.close()
@@ -1,7 +1,7 @@
 """
 任务模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from services.database import Base
@@ -9,6 +9,11 @@ from services.database import Base
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # 任务列表按用户查询并按创建时间排序，可选按状态过滤
+        Index("ix_tasks_user_created", "user_id", "created_at"),
+        Index("ix_tasks_user_status_created", "user_id", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)  # 任务名称
@@ -41,5 +46,5 @@ class QuickProject(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # 关联用户
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", backref="quick_projects")
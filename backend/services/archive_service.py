@@ -0,0 +1,150 @@
+"""
+目录打包服务
+边遍历边压缩，将 tar.gz / zip 数据分块交给调用方流式输出，不落临时文件
+"""
+import gzip
+import io
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+from typing import Callable, List, Optional
+
+from services.file_ops import is_special_file
+from services.file_search import NameMatcher
+from services.fs_walker import ParallelWalker, SKIP
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = ("tar.gz", "zip")
+ARCHIVE_MEDIA_TYPES = {
+    "tar.gz": "application/gzip",
+    "zip": "application/zip",
+}
+
+# 每次向调用方交出的数据块大小
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+
+class ArchiveCancelled(Exception):
+    """消费方已离开（如客户端断开下载）"""
+
+
+class _ChunkedOutput(io.RawIOBase):
+    """只写、不可 seek 的输出流，攒够一块后通过 emit 交出"""
+
+    def __init__(self, emit: Callable[[bytes], bool]):
+        self._emit = emit
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= OUTPUT_CHUNK_SIZE:
+            self._send(bytes(self._buffer[:OUTPUT_CHUNK_SIZE]))
+            del self._buffer[:OUTPUT_CHUNK_SIZE]
+        return len(data)
+
+    def finish(self):
+        if self._buffer:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _send(self, chunk: bytes):
+        if not self._emit(chunk):
+            raise ArchiveCancelled()
+
+
+def _is_special(path: str) -> bool:
+    if is_special_file(path):
+        logger.debug(f"打包时跳过特殊文件: {path}")
+        return True
+    return False
+
+
+def _build_matchers(globs: Optional[List[str]]) -> List[NameMatcher]:
+    return [NameMatcher(g, mode="glob") for g in (globs or []) if g]
+
+
+def write_archive(
+    root: str,
+    fmt: str,
+    emit: Callable[[bytes], bool],
+    cancel_event: threading.Event,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    show_hidden: bool = True,
+    respect_gitignore: bool = False,
+    compresslevel: int = 6,
+):
+    """
+    将 root 目录打包并分块输出
+
+    - include: 只打包匹配任一 glob 的文件（目录始终遍历）
+    - exclude: 匹配任一 glob 的文件或目录被跳过（目录不再深入）
+    压缩包内路径以 root 的目录名为顶层目录。
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的压缩格式: {fmt}")
+
+    include_matchers = _build_matchers(include)
+    exclude_matchers = _build_matchers(exclude)
+    top = os.path.basename(os.path.normpath(root)) or "archive"
+    out = _ChunkedOutput(emit)
+
+    # 单线程遍历：压缩流只能顺序写入
+    walker = ParallelWalker(
+        root,
+        workers=1,
+        show_hidden=show_hidden,
+        respect_gitignore=respect_gitignore,
+        cancel_event=cancel_event,
+    )
+
+    def selected(entry, rel_path, is_dir):
+        if any(m.match(entry.name, rel_path) is not None for m in exclude_matchers):
+            return False
+        if is_dir or not include_matchers:
+            return True
+        return any(m.match(entry.name, rel_path) is not None for m in include_matchers)
+
+    try:
+        if fmt == "tar.gz":
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=compresslevel) as gz:
+                with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                    def add_tar(entry, rel_path, is_dir):
+                        if not selected(entry, rel_path, is_dir):
+                            return SKIP
+                        # 只打包普通文件、目录与符号链接
+                        if not is_dir and _is_special(entry.path):
+                            return True
+                        try:
+                            # 符号链接按链接本身存储，不读取目标内容
+                            tar.add(entry.path, arcname=f"{top}/{rel_path}", recursive=False)
+                        except OSError:
+                            pass
+                        return True
+
+                    walker.walk(add_tar)
+        else:
+            with zipfile.ZipFile(out, mode="w", compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=compresslevel) as zf:
+                def add_zip(entry, rel_path, is_dir):
+                    if not selected(entry, rel_path, is_dir):
+                        return SKIP
+                    # 只打包普通文件与目录；zip 会跟随符号链接读取目标，可能越出允许的目录，也跳过
+                    if entry.is_symlink() or (not is_dir and _is_special(entry.path)):
+                        return True
+                    try:
+                        zf.write(entry.path, arcname=f"{top}/{rel_path}")
+                    except OSError:
+                        pass
+                    return True
+
+                walker.walk(add_zip)
+        out.finish()
+    except ArchiveCancelled:
+        cancel_event.set()
@@ -1,16 +1,21 @@
 """
 认证服务
 """
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from config import settings
-from services.database import get_db
+from services.database import get_async_db
 from models.user import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -48,9 +53,67 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
+class TokenCache:
+    """
+    已验证 token 的缓存（TTL + LRU）
+
+    缓存 token 对应用户的列值快照，命中时不再解码 JWT、不再查询数据库；
+    每次命中返回新的临时 User 对象，不会被某个请求的数据库会话关联或过期。
+    条目在 TTL 与 token 自身的过期时间中较早者失效，修改密码或禁用用户时按用户名清除。
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[User]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._entries.get(token)
+            if item is None:
+                return None
+            expires_at, values = item
+            if time.time() >= expires_at:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+        return User(**values)
+
+    def put(self, token: str, payload: dict, user: User):
+        if self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self._lock:
+            self._entries[token] = (expires_at, values)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        """清除该用户的所有缓存条目（修改密码、禁用用户后调用）"""
+        with self._lock:
+            for token in [t for t, (_, values) in self._entries.items() if values["username"] == username]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 全局单例
+token_cache = TokenCache(ttl=settings.auth_cache_ttl, max_entries=settings.auth_cache_max_entries)
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """获取当前用户"""
     credentials_exception = HTTPException(
@@ -58,6 +121,10 @@ async def get_current_user(
         detail="无效的认证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     payload = decode_token(token)
     if payload is None:
         raise credentials_exception
@@ -66,10 +133,11 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
         raise credentials_exception
 
+    token_cache.put(token, payload, user)
     return user
 
 
@@ -83,9 +151,13 @@ async def get_current_active_user(
 
 
 def verify_token(token: str, db: Session = None) -> Optional[User]:
-    """验证 token 并返回用户（用于 WebSocket）"""
+    """验证 token 并返回用户（同步版本，供线程池等非异步代码使用）"""
     from services.database import SessionLocal
 
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     payload = decode_token(token)
     if payload is None:
         return None
@@ -98,8 +170,35 @@ def verify_token(token: str, db: Session = None) -> Optional[User]:
         db = SessionLocal()
         try:
             user = db.query(User).filter(User.username == username).first()
-            return user
         finally:
             db.close()
     else:
-        return db.query(User).filter(User.username == username).first()
+        user = db.query(User).filter(User.username == username).first()
+
+    if user is not None:
+        token_cache.put(token, payload, user)
+    return user
+
+
+async def verify_token_async(token: str) -> Optional[User]:
+    """验证 token 并返回用户（用于 WebSocket 与反向代理，查询不阻塞事件循环）"""
+    from services.database import AsyncSessionLocal
+
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
+    payload = decode_token(token)
+    if payload is None:
+        return None
+
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.username == username))
+
+    if user is not None:
+        token_cache.put(token, payload, user)
+    return user
@@ -0,0 +1,82 @@
+"""
+阻塞 I/O 线程池
+将文件系统等阻塞操作放到有界线程池执行，避免卡住驱动终端 WebSocket 的事件循环；
+客户端断开时通知可取消的操作尽快结束
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from config import settings
+
+T = TypeVar("T")
+
+# 检测客户端断开的轮询间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.25
+
+file_io_executor = ThreadPoolExecutor(
+    max_workers=settings.file_io_workers,
+    thread_name_prefix="file-io",
+)
+
+
+async def run_io(
+    func: Callable[..., T],
+    *args,
+    request: Optional[Request] = None,
+    cancellable: bool = False,
+    **kwargs,
+) -> T:
+    """
+    在文件 I/O 线程池中执行 func
+
+    - request: 提供时监听客户端断开，断开后返回 499 且不再等待结果
+    - cancellable: 为 True 时向 func 传入 cancel_event 关键字参数，
+      断开时置位，func 应在循环中检查并尽快返回
+    """
+    loop = asyncio.get_running_loop()
+    cancel_event = threading.Event()
+    if cancellable:
+        kwargs["cancel_event"] = cancel_event
+    future = loop.run_in_executor(file_io_executor, functools.partial(func, *args, **kwargs))
+
+    if request is None:
+        return await future
+
+    async def watch_disconnect():
+        while True:
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        done, _ = await asyncio.wait({future, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+    finally:
+        watcher.cancel()
+
+    if future in done:
+        return future.result()
+
+    # 客户端已断开：通知工作线程停止，结果交由后台丢弃
+    cancel_event.set()
+    future.add_done_callback(_consume_result)
+    raise HTTPException(status_code=499, detail="客户端已断开")
+
+
+def _consume_result(future):
+    """取走已放弃的任务结果，避免未获取异常的警告"""
+    if not future.cancelled():
+        future.exception()
+
+
+def shutdown():
+    """关闭线程池（不等待仍在执行的任务）"""
+    file_io_executor.shutdown(wait=False, cancel_futures=True)
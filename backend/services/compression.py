@@ -0,0 +1,208 @@
+"""
+响应压缩中间件
+按 Accept-Encoding 协商 zstd / brotli / gzip，对允许的内容类型按块压缩，
+支持流式响应（每块同步刷新，不增加 SSE / NDJSON 的延迟）；
+已带 Content-Encoding 的响应（如上游已压缩的代理响应）原样透传
+"""
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._obj = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=settings.compression_brotli_quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encoders() -> Dict[str, type]:
+    """按服务端偏好排序的可用编码（brotli / zstandard 未安装时跳过）"""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    encoders["gzip"] = _GzipEncoder
+    return encoders
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """解析 Accept-Encoding 为 {编码: q 值}"""
+    accepted = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str, encoders: Dict[str, type]) -> Optional[str]:
+    """选择客户端接受（q > 0）且服务端支持的编码，q 值相同时按服务端偏好"""
+    accepted = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for name in encoders:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI 响应压缩中间件"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int, content_types: List[str]):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(t.strip().lower() for t in content_types if t.strip())
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encoders)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return any(content_type.startswith(t) for t in self.content_types)
+
+
+class _CompressingResponder:
+    """拦截单个响应的 send，按需压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start: Optional[Message] = None
+        self._encoder = None
+        self._passthrough = False
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            status = message["status"]
+            if status < 200 or status in (204, 206, 304) or not self.middleware.compressible(headers):
+                self._passthrough = True
+            else:
+                length = headers.get("content-length")
+                if length is not None and length.isdigit() and int(length) < self.middleware.minimum_size:
+                    self._passthrough = True
+            if self._passthrough:
+                await self._send(message)
+            else:
+                # 等待第一块响应体再决定是否压缩
+                self._start = message
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # 完整响应体太小，压缩收益不抵开销
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self._encoder = self.middleware.encoders[self.encoding]()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # 压缩后的表示与原始字节不同，强 ETag 降为弱 ETag
+                headers["etag"] = "W/" + etag
+            if more_body:
+                del headers["content-length"]
+                await self._send(start)
+            else:
+                data = self._encoder.compress(body) + self._encoder.finish()
+                headers["content-length"] = str(len(data))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": data})
+                return
+
+        if more_body:
+            # 每块同步刷新，保证流式响应的实时性
+            data = self._encoder.compress(body) + self._encoder.flush()
+            if data:
+                await self._send({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            data = self._encoder.compress(body) + self._encoder.finish()
+            await self._send({"type": "http.response.body", "body": data})
+
@@ -1,24 +1,116 @@
 """
 数据库服务
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
 from config import settings
 
-# SQLite 配置：使用 StaticPool 避免连接池耗尽问题
-# StaticPool 为整个进程维护单个连接，适合 SQLite 单文件数据库
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False},  # SQLite 需要
-    poolclass=StaticPool,  # 使用静态连接池，避免连接泄漏
-    echo=False  # 设置为 True 可以看到 SQL 日志
+
+def _is_memory_sqlite(url) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def shared_memory_url(database_url: str) -> str:
+    """
+    内存 SQLite 改用进程内共享缓存的命名数据库
+
+    普通内存数据库只存在于单个连接中，同步引擎与异步引擎各自的连接会看到两个不同的空库；
+    共享缓存的命名数据库可以被同一进程中的多个连接打开（只要仍有连接未关闭）
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite" or not _is_memory_sqlite(url):
+        return database_url
+    name = url.database if url.database and url.database.startswith("file:") else "file:claude_remote"
+    url = url.set(database=name, query={**url.query, "mode": "memory", "cache": "shared", "uri": "true"})
+    return url.render_as_string(hide_password=False)
+
+
+# 同步驱动对应的异步驱动
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_database_url(database_url: str) -> str:
+    """把 database_url 换成对应的异步驱动（已指定异步驱动时原样返回）"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() in ("aiosqlite", "asyncpg", "aiomysql", "psycopg"):
+        return database_url
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"不支持异步访问的数据库: {backend}")
+    return url.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def _engine_options(database_url: str, is_async: bool = False) -> dict:
+    """按数据库类型生成 create_engine 参数"""
+    url = make_url(database_url)
+    options = {"echo": False}  # 设置为 True 可以看到 SQL 日志
+    if url.get_backend_name() != "sqlite":
+        options.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow,
+                       pool_pre_ping=True)
+        return options
+
+    # 连接会在线程池与事件循环线程之间传递
+    options["connect_args"] = {"check_same_thread": False}
+    if _is_memory_sqlite(url):
+        # 每个引擎只保持一个连接，连接一直打开，共享缓存中的内存数据库就不会被释放
+        options["poolclass"] = StaticPool
+    else:
+        # 文件数据库：每个并发使用者取得各自的连接，配合 WAL 读写互不阻塞
+        options.update(poolclass=AsyncAdaptedQueuePool if is_async else QueuePool,
+                       pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow)
+    return options
+
+
+# 内存数据库需要同步与异步引擎访问同一个库
+database_url = shared_memory_url(settings.database_url)
+
+engine = create_engine(database_url, **_engine_options(database_url))
+
+# 异步引擎：请求处理函数中的查询不阻塞事件循环（SQLite 使用 aiosqlite）
+async_engine = create_async_engine(
+    async_database_url(database_url),
+    **_engine_options(database_url, is_async=True)
 )
 
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        每个新连接设置 SQLite 参数
+
+        - WAL：读操作不会被写操作阻塞，写操作也不阻塞读
+        - synchronous=NORMAL：WAL 模式下仍保证数据库一致性，只在掉电时可能丢失最近提交
+        - busy_timeout：写锁被占用时等待而不是立即报 database is locked
+        - mmap_size：读操作通过内存映射访问数据库文件，减少系统调用
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            if not _is_memory_sqlite(engine.url):
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        finally:
+            cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 提交后不过期已加载的属性，避免在 await 之外触发隐式加载
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -31,6 +123,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_tables():
     """创建所有表"""
     Base.metadata.create_all(bind=engine)
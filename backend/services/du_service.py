@@ -0,0 +1,250 @@
+"""
+目录占用空间统计服务
+并行逐层遍历目录树，按目录 mtime 缓存每个目录自身的统计结果并持久化到磁盘，
+再次统计时只重新扫描 mtime 发生变化的目录
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.file_ops import atomic_write
+
+CACHE_VERSION = 1
+
+# 缓存条目字段：[目录 mtime_ns, 自身占用, 自身文件数, 子目录名列表, 总占用, 总文件数, 总子目录数]
+_MTIME, _OWN_SIZE, _OWN_FILES, _CHILDREN, _TOTAL_SIZE, _TOTAL_FILES, _TOTAL_DIRS = range(7)
+
+
+class DiskUsageCache:
+    """
+    目录占用空间缓存
+
+    目录的 mtime 只在其直接子项增删或重命名时变化，原地改写文件不会更新它，
+    因此缓存结果可能略微滞后；需要精确结果时使用 refresh 强制全量扫描。
+    """
+
+    def __init__(self, cache_file: str, workers: int, save_interval: float):
+        self.cache_file = os.path.expanduser(cache_file)
+        self.save_interval = save_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="du")
+        self._entries: Dict[str, list] = {}
+        self._loaded = False
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self._entries = data.get("entries", {})
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def save(self):
+        """将缓存写入磁盘（无变化时跳过）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"version": CACHE_VERSION, "entries": self._entries},
+                              ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            atomic_write(self.cache_file, data)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+
+    def _schedule_save(self):
+        """延迟写入缓存，合并间隔内多次统计的变化，避免每次统计都重写整个缓存文件"""
+        if self.save_interval <= 0:
+            self.save()
+            return
+        with self._lock:
+            if not self._dirty or self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_interval, self._timed_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _timed_save(self):
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def _forget(self, path: str):
+        """移除目录及其整个子树的缓存（调用方持有锁）"""
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return
+        self._dirty = True
+        for name in entry[_CHILDREN]:
+            self._forget(os.path.join(path, name))
+
+    def _visit(self, path: str, refresh: bool) -> Tuple[str, Optional[list], bool]:
+        """
+        统计单个目录自身（不含子目录）
+
+        返回 (路径, 条目, 是否重新扫描)；mtime 未变时直接使用缓存。
+        """
+        try:
+            st = os.lstat(path)
+        except OSError:
+            with self._lock:
+                self._forget(path)
+            return path, None, False
+
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached is not None and not refresh and cached[_MTIME] == st.st_mtime_ns:
+            return path, list(cached), False
+
+        own_size = st.st_blocks * 512
+        own_files = 0
+        children: List[str] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.name)
+                            continue
+                        own_size += entry.stat(follow_symlinks=False).st_blocks * 512
+                        own_files += 1
+                    except OSError:
+                        continue
+        except OSError:
+            # 无权限读取的目录只计自身占用
+            pass
+
+        if cached is not None:
+            removed = set(cached[_CHILDREN]) - set(children)
+            if removed:
+                with self._lock:
+                    for name in removed:
+                        self._forget(os.path.join(path, name))
+        return path, [st.st_mtime_ns, own_size, own_files, children, 0, 0, 0], True
+
+    def compute(self, root: str, refresh: bool = False,
+                cancel_event: Optional[threading.Event] = None,
+                progress: Optional[Callable[[int, int], None]] = None) -> Optional[dict]:
+        """
+        统计目录总占用（阻塞，应在线程池中调用）
+
+        逐层并行访问目录，再自底向上汇总；被取消时返回 None。
+        progress(已统计项数, 已统计字节数) 在每个目录统计完后调用，可抛出异常中断遍历。
+        """
+        self._load()
+        try:
+            return self._compute(root, refresh, cancel_event, progress)
+        finally:
+            self._schedule_save()
+
+    def _compute(self, root: str, refresh: bool, cancel_event: Optional[threading.Event],
+                 progress: Optional[Callable[[int, int], None]]) -> Optional[dict]:
+        nodes: Dict[str, list] = {}
+        order: List[str] = []
+        scanned = 0
+        items = 0
+        nbytes = 0
+        frontier = [root]
+        while frontier:
+            next_frontier = []
+            for path, node, rescanned in self._executor.map(lambda p: self._visit(p, refresh), frontier):
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                if node is None:
+                    continue
+                scanned += rescanned
+                nodes[path] = node
+                order.append(path)
+                next_frontier.extend(os.path.join(path, name) for name in node[_CHILDREN])
+                if progress is not None:
+                    items += node[_OWN_FILES] + (path != root)
+                    nbytes += node[_OWN_SIZE]
+                    progress(items, nbytes)
+            frontier = next_frontier
+
+        if root not in nodes:
+            raise FileNotFoundError(root)
+
+        for path in reversed(order):
+            node = nodes[path]
+            total_size, total_files, total_dirs = node[_OWN_SIZE], node[_OWN_FILES], 0
+            for name in node[_CHILDREN]:
+                child = nodes.get(os.path.join(path, name))
+                if child is None:
+                    continue
+                total_size += child[_TOTAL_SIZE]
+                total_files += child[_TOTAL_FILES]
+                total_dirs += child[_TOTAL_DIRS] + 1
+            node[_TOTAL_SIZE], node[_TOTAL_FILES], node[_TOTAL_DIRS] = total_size, total_files, total_dirs
+
+        with self._lock:
+            for path, node in nodes.items():
+                if self._entries.get(path) != node:
+                    self._entries[path] = node
+                    self._dirty = True
+
+        root_node = nodes[root]
+        children = []
+        for name in root_node[_CHILDREN]:
+            child = nodes.get(os.path.join(root, name))
+            if child is not None:
+                children.append({
+                    "name": name,
+                    "path": os.path.join(root, name),
+                    "size": child[_TOTAL_SIZE],
+                    "files": child[_TOTAL_FILES],
+                })
+        children.sort(key=lambda c: c["size"], reverse=True)
+        return {
+            "path": root,
+            "size": root_node[_TOTAL_SIZE],
+            "files": root_node[_TOTAL_FILES],
+            "dirs": root_node[_TOTAL_DIRS],
+            "own_size": root_node[_OWN_SIZE],
+            "children": children,
+            "scanned_dirs": scanned,
+            "cached_dirs": len(order) - scanned,
+        }
+
+    def cached_size(self, path: str) -> Optional[int]:
+        """
+        返回缓存中的目录总占用，不触发扫描
+
+        只校验目录自身的 mtime，子目录的变化要到下次统计时才会反映。
+        """
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        try:
+            if os.lstat(path).st_mtime_ns != entry[_MTIME]:
+                return None
+        except OSError:
+            return None
+        return entry[_TOTAL_SIZE]
+
+    def shutdown(self):
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+        self.save()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局单例
+du_cache = DiskUsageCache(settings.du_cache_file, settings.du_workers, settings.du_cache_save_interval)
@@ -0,0 +1,106 @@
+"""
+文本编码检测
+基于 BOM 与有限长度采样判断编码，结果按 路径 + mtime + 大小 缓存
+"""
+import codecs
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+
+# 采样长度：只用文件开头这部分字节判断编码
+SAMPLE_SIZE = 64 * 1024
+
+# 首选编码失败后依次尝试的编码（gb2312 是 gbk 的子集，无需单独尝试）
+FALLBACK_ENCODINGS = ("utf-8", "gbk", "latin-1")
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def sniff_bom(data: bytes) -> Optional[str]:
+    """根据 BOM 判断编码（UTF-32 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断）"""
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding
+    return None
+
+
+def _sample_decodes(sample: bytes, encoding: str, complete: bool) -> bool:
+    """采样能否按 encoding 解码；采样被截断时允许末尾有不完整的多字节字符"""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        decoder.decode(sample, final=complete)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def candidate_encodings(data: bytes, preferred: str = "utf-8") -> Tuple[str, ...]:
+    """
+    按可能性排序的候选编码
+
+    有 BOM 时直接确定；否则用采样过滤掉明显不匹配的编码，
+    首选编码排在最前，latin-1 始终兜底。
+    """
+    bom_encoding = sniff_bom(data)
+    if bom_encoding:
+        return (bom_encoding,)
+
+    sample = data[:SAMPLE_SIZE]
+    complete = len(data) <= SAMPLE_SIZE
+    ordered = [preferred] + [e for e in FALLBACK_ENCODINGS if e != preferred]
+    passed = tuple(e for e in ordered if _sample_decodes(sample, e, complete))
+    return passed or ("latin-1",)
+
+
+def decode_bytes(data: bytes, preferred: str = "utf-8",
+                 known: Optional[str] = None) -> Tuple[str, str]:
+    """
+    解码字节内容，返回 (文本, 实际使用的编码)
+
+    known 为缓存的编码时优先使用；采样通过但全文解码失败时继续尝试下一个候选，
+    全部在内存中完成，不会重复读取文件。
+    """
+    if known:
+        try:
+            return data.decode(known), known
+        except (UnicodeDecodeError, LookupError):
+            pass
+    for encoding in candidate_encodings(data, preferred):
+        try:
+            return data.decode(encoding), encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return data.decode("latin-1"), "latin-1"
+
+
+class EncodingCache:
+    """编码检测结果缓存（LRU）"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            encoding = self._entries.get(key)
+            if encoding is not None:
+                self._entries.move_to_end(key)
+            return encoding
+
+    def put(self, key: tuple, encoding: str):
+        with self._lock:
+            self._entries[key] = encoding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# 全局单例
+encoding_cache = EncodingCache()
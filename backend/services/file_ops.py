@@ -0,0 +1,193 @@
+"""
+文件操作工具
+原子写入（临时文件 + 重命名）与内容校验
+"""
+import hashlib
+import os
+import re
+import stat
+import tempfile
+import threading
+from typing import Callable, Iterable, Optional, Tuple
+
+# 进程 umask（在导入时读取一次，避免运行中修改 umask 影响其他线程）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def sha256_bytes(data: bytes) -> str:
+    """计算字节内容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_in_place(path: str, data: bytes) -> os.stat_result:
+    """直接覆盖写入已有文件（保留 inode，用于有多个硬链接的文件）"""
+    with open(path, "r+b") as f:
+        f.write(data)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    return os.stat(path)
+
+
+def atomic_write(path: str, data: bytes) -> os.stat_result:
+    """
+    原子写入文件
+
+    先写入同目录下的临时文件并 fsync，再 os.replace 覆盖目标，
+    崩溃或并发读取时只会看到旧内容或新内容，不会出现截断文件。
+    符号链接写入其指向的文件；已存在的文件保留原有权限与属主（尽力而为）；
+    有多个硬链接的文件无法通过替换保持链接，改为直接覆盖写入。返回写入后的 stat 结果。
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path) or "."
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    if st is not None and st.st_nlink > 1:
+        return _write_in_place(path, data)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if st is not None:
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except OSError:
+                # 非 root 用户通常不能修改属主，保持为当前用户
+                pass
+            # chown 会清除 setuid/setgid 位，放在其后设置权限
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+        else:
+            # mkstemp 创建的文件为 0600，新文件按 umask 设置常规权限
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return os.stat(path)
+
+
+def is_special_file(path: str) -> bool:
+    """
+    是否为 FIFO、设备文件、socket 等特殊文件（不跟随符号链接）
+
+    读取 FIFO 会阻塞，读取设备文件可能永不结束，复制、打包时都应跳过。
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError:
+        return False
+    return not (stat.S_ISREG(mode) or stat.S_ISDIR(mode) or stat.S_ISLNK(mode))
+
+
+def mtime_matches(stat: os.stat_result, expected: float) -> bool:
+    """比较 mtime（客户端拿到的是浮点秒，允许微秒级误差）"""
+    return abs(stat.st_mtime - expected) < 1e-6
+
+
+# 与读取文件时的行号计算一致：只有 \r\n、\r、\n 是换行符
+# （str.splitlines 还会在 \x0b、\x0c、\x1c-\x1e、\x85、\u2028、\u2029 处分行）
+_LINE = re.compile(r".*?(?:\r\n|\r|\n)|.+\Z", re.S)
+
+
+def split_lines(text: str) -> list:
+    """按换行符分行，保留行尾换行符"""
+    return _LINE.findall(text)
+
+
+def apply_line_edits(text: str, edits: Iterable[Tuple[int, int, str]]) -> str:
+    """
+    按行区间应用编辑
+
+    每个编辑为 (start_line, end_line, new_text)，用 new_text 替换
+    [start_line, end_line) 行（从 0 开始，start == end 表示插入）。
+    new_text 原样插入，需自带换行符。编辑区间不能重叠，越界抛出 ValueError。
+    """
+    lines = split_lines(text)
+    ordered = sorted(edits, key=lambda e: (e[0], e[1]))
+
+    prev_end = -1
+    for start, end, _ in ordered:
+        if start < 0 or end < start or end > len(lines):
+            raise ValueError(f"编辑区间越界: [{start}, {end})，文件共 {len(lines)} 行")
+        if start < prev_end:
+            raise ValueError(f"编辑区间重叠: [{start}, {end})")
+        prev_end = end
+
+    # 从后往前替换，前面的行号不受影响
+    for start, end, new_text in reversed(ordered):
+        lines[start:end] = [new_text]
+    return "".join(lines)
+
+
+def _raise(error: OSError):
+    raise error
+
+
+def remove_tree(
+    path: str,
+    cancel_event: Optional[threading.Event] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> bool:
+    """
+    可取消的递归删除（shutil.rmtree 的替代）
+
+    自底向上删除，每删除一项检查 cancel_event；on_progress(items, bytes)
+    报告累计删除的条目数与文件字节数。不跟随符号链接。
+    被取消时返回 False（目录可能已被部分删除）。
+    """
+    items = 0
+    freed = 0
+
+    def removed(size: int = 0):
+        nonlocal items, freed
+        items += 1
+        freed += size
+        if on_progress is not None:
+            on_progress(items, freed)
+
+    for dir_path, dir_names, file_names in os.walk(path, topdown=False, onerror=_raise):
+        for name in file_names:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            full = os.path.join(dir_path, name)
+            size = os.lstat(full).st_size
+            os.unlink(full)
+            removed(size)
+        for name in dir_names:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            full = os.path.join(dir_path, name)
+            # 指向目录的符号链接出现在 dir_names 中，只删除链接本身
+            if os.path.islink(full):
+                os.unlink(full)
+            else:
+                os.rmdir(full)
+            removed()
+
+    os.rmdir(path)
+    removed()
+    return True
+
+
+def read_bytes(path: str, cancel_event: Optional[threading.Event] = None,
+               chunk_size: int = 1024 * 1024) -> Optional[bytes]:
+    """分块读取文件，被取消时返回 None"""
+    chunks = []
+    with open(path, "rb") as f:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks)
@@ -0,0 +1,365 @@
+"""
+文件搜索服务
+在目录树中按文件名（glob / 模糊 / 子串）查找文件，或按内容（正则 / 字面量）搜索
+"""
+import mmap
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Pattern
+
+from services.fs_walker import ParallelWalker
+from services.ignore_rules import translate_glob
+
+SEARCH_MODES = ("glob", "fuzzy", "substring")
+
+# 内容搜索：用于判断二进制文件的采样大小
+BINARY_SNIFF_SIZE = 8192
+# 超过该大小的文件使用 mmap，避免整体读入内存
+MMAP_THRESHOLD = 1024 * 1024
+# 返回的单行最大字符数（压缩后的 JS 等超长行会被截断）
+MAX_LINE_CHARS = 500
+
+
+class NameMatcher:
+    """
+    文件名匹配器
+
+    match() 返回匹配分数（越大越相关），不匹配返回 None。
+    glob 模式中含 `/` 时匹配相对路径，否则只匹配文件名。
+    """
+
+    def __init__(self, pattern: str, mode: str = "glob", case_sensitive: bool = False):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"不支持的匹配模式: {mode}")
+        self.mode = mode
+        self.case_sensitive = case_sensitive
+        self.pattern = pattern if case_sensitive else pattern.lower()
+        self.match_path = mode == "glob" and "/" in pattern
+        if mode == "glob":
+            flags = 0 if case_sensitive else re.IGNORECASE
+            self._regex = re.compile(translate_glob(pattern.lstrip("/")) + r"\Z", flags)
+
+    def match(self, name: str, rel_path: str) -> Optional[float]:
+        if self.mode == "glob":
+            target = rel_path if self.match_path else name
+            return 1.0 if self._regex.match(target) else None
+
+        target = name if self.case_sensitive else name.lower()
+        if self.mode == "substring":
+            pos = target.find(self.pattern)
+            if pos < 0:
+                return None
+            # 越靠前、文件名越短，分数越高
+            return 1.0 + (1.0 if pos == 0 else 0.0) + len(self.pattern) / len(target)
+        return fuzzy_score(self.pattern, target)
+
+
+def fuzzy_score(pattern: str, text: str) -> Optional[float]:
+    """
+    子序列模糊匹配打分
+
+    pattern 的字符需按顺序出现在 text 中；连续命中、单词开头命中加分，
+    文本越长分数越低。不匹配返回 None。
+    """
+    if not pattern:
+        return 0.0
+    score = 0.0
+    ti = 0
+    prev = -2
+    n = len(text)
+    for ch in pattern:
+        pos = text.find(ch, ti)
+        if pos < 0:
+            return None
+        score += 1.0
+        if pos == prev + 1:
+            score += 2.0
+        if pos == 0 or text[pos - 1] in "._-/ ":
+            score += 1.5
+        prev = pos
+        ti = pos + 1
+    return score / len(pattern) - (n - len(pattern)) * 0.01
+
+
+def search_names(
+    root: str,
+    matcher: NameMatcher,
+    emit: Callable[[dict], bool],
+    cancel_event: threading.Event,
+    workers: int = 8,
+    show_hidden: bool = False,
+    respect_gitignore: bool = True,
+    include_dirs: bool = True,
+    max_results: int = 500,
+    timeout: float = 10.0,
+) -> dict:
+    """
+    遍历 root 查找匹配的文件，每找到一个结果立即通过 emit 交出
+
+    返回搜索摘要（匹配数、是否截断/超时、扫描统计）。
+    """
+    started = time.monotonic()
+    walker = ParallelWalker(
+        root,
+        workers=workers,
+        show_hidden=show_hidden,
+        respect_gitignore=respect_gitignore,
+        cancel_event=cancel_event,
+        deadline=started + timeout,
+    )
+    lock = threading.Lock()
+    state = {"count": 0, "truncated": False}
+
+    def on_entry(entry, rel_path, is_dir):
+        if is_dir and not include_dirs:
+            return True
+        score = matcher.match(entry.name, rel_path)
+        if score is None:
+            return True
+
+        try:
+            stat = entry.stat(follow_symlinks=False)
+            size = 0 if is_dir else stat.st_size
+            modified = stat.st_mtime
+        except OSError:
+            size, modified = 0, 0.0
+
+        with lock:
+            if state["count"] >= max_results:
+                state["truncated"] = True
+                return False
+            state["count"] += 1
+
+        return emit({
+            "type": "match",
+            "path": entry.path,
+            "rel_path": rel_path,
+            "name": entry.name,
+            "is_dir": is_dir,
+            "size": size,
+            "modified": modified,
+            "score": round(score, 3),
+        })
+
+    walker.walk(on_entry)
+
+    return {
+        "type": "done",
+        "count": state["count"],
+        "truncated": state["truncated"],
+        "timed_out": walker.timed_out,
+        "dirs_scanned": walker.dirs_scanned,
+        "entries_scanned": walker.entries_seen,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
+
+
+def compile_content_pattern(pattern: str, is_regex: bool = False,
+                            case_sensitive: bool = False) -> Pattern[bytes]:
+    """
+    编译内容搜索模式（按 UTF-8 字节匹配，可直接用于 mmap）
+
+    正则无效时抛出 re.error。
+    """
+    raw = pattern.encode("utf-8")
+    if not is_regex:
+        raw = re.escape(raw)
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    return re.compile(raw, flags)
+
+
+def _decode_line(data: bytes) -> str:
+    text = data.decode("utf-8", errors="replace").rstrip("\r")
+    if len(text) > MAX_LINE_CHARS:
+        text = text[:MAX_LINE_CHARS] + "…"
+    return text
+
+
+def _context_before(buf, line_start: int, count: int) -> List[str]:
+    """取 line_start 所在行之前的 count 行"""
+    lines = []
+    end = line_start - 1
+    while count > 0 and end >= 0:
+        start = buf.rfind(b"\n", 0, end) + 1
+        lines.append(_decode_line(buf[start:end]))
+        end = start - 1
+        count -= 1
+    lines.reverse()
+    return lines
+
+
+def _context_after(buf, line_end: int, count: int) -> List[str]:
+    """取 line_end（换行符位置）之后的 count 行"""
+    lines = []
+    size = len(buf)
+    start = line_end + 1
+    while count > 0 and start < size:
+        end = buf.find(b"\n", start)
+        if end < 0:
+            end = size
+        lines.append(_decode_line(buf[start:end]))
+        start = end + 1
+        count -= 1
+    return lines
+
+
+def grep_buffer(buf, regex: Pattern[bytes], context: int = 0,
+                max_matches: int = 100) -> List[dict]:
+    """
+    在字节缓冲区（bytes 或 mmap）中搜索，按行返回命中
+
+    同一行多处命中只返回一次；行号从 1 开始。
+    """
+    results = []
+    size = len(buf)
+    pos = 0
+    line_no = 1
+    counted_to = 0
+    while pos <= size and len(results) < max_matches:
+        m = regex.search(buf, pos)
+        if m is None:
+            break
+        start = m.start()
+        line_start = buf.rfind(b"\n", 0, start) + 1
+        line_end = buf.find(b"\n", start)
+        if line_end < 0:
+            line_end = size
+        # 增量统计换行数得到行号，避免每次从头计数（mmap 没有 count，按片段统计）
+        line_no += buf[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+
+        item = {
+            "line": line_no,
+            "column": len(buf[line_start:start].decode("utf-8", errors="replace")) + 1,
+            "text": _decode_line(buf[line_start:line_end]),
+        }
+        if context > 0:
+            item["before"] = _context_before(buf, line_start, context)
+            item["after"] = _context_after(buf, line_end, context)
+        results.append(item)
+        pos = line_end + 1
+    return results
+
+
+def grep_file(path: str, size: int, regex: Pattern[bytes], context: int = 0,
+              max_matches: int = 100) -> Optional[List[dict]]:
+    """
+    搜索单个文件，二进制文件返回 None
+
+    小文件整体读入，大文件使用 mmap 由内核按需换页。
+    """
+    with open(path, "rb") as f:
+        head = f.read(BINARY_SNIFF_SIZE)
+        if b"\0" in head:
+            return None
+        if size <= len(head):
+            return grep_buffer(head, regex, context, max_matches)
+        if size < MMAP_THRESHOLD:
+            return grep_buffer(head + f.read(), regex, context, max_matches)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return grep_buffer(mm, regex, context, max_matches)
+
+
+def search_contents(
+    root: str,
+    regex: Pattern[bytes],
+    emit: Callable[[dict], bool],
+    cancel_event: threading.Event,
+    include: Optional[NameMatcher] = None,
+    context: int = 0,
+    workers: int = 8,
+    show_hidden: bool = False,
+    respect_gitignore: bool = True,
+    max_matches: int = 1000,
+    max_matches_per_file: int = 100,
+    max_file_size: int = 50 * 1024 * 1024,
+    timeout: float = 10.0,
+) -> dict:
+    """
+    遍历 root 搜索文件内容，每个有命中的文件立即通过 emit 交出
+
+    遍历线程同时负责搜索文件，跳过二进制文件、超大文件及被忽略的路径。
+    返回搜索摘要。
+    """
+    started = time.monotonic()
+    walker = ParallelWalker(
+        root,
+        workers=workers,
+        show_hidden=show_hidden,
+        respect_gitignore=respect_gitignore,
+        cancel_event=cancel_event,
+        deadline=started + timeout,
+    )
+    lock = threading.Lock()
+    state = {"matches": 0, "files_matched": 0, "files_searched": 0,
+             "skipped": 0, "truncated": False}
+
+    def on_entry(entry, rel_path, is_dir):
+        if is_dir:
+            return True
+        if include is not None and include.match(entry.name, rel_path) is None:
+            return True
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                return True
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            return True
+        if size == 0:
+            return True
+        if size > max_file_size:
+            with lock:
+                state["skipped"] += 1
+            return True
+
+        with lock:
+            remaining = max_matches - state["matches"]
+            if remaining <= 0:
+                state["truncated"] = True
+                return False
+
+        try:
+            matches = grep_file(entry.path, size, regex, context,
+                                min(max_matches_per_file, remaining))
+        except (OSError, ValueError):
+            matches = None
+        with lock:
+            state["files_searched"] += 1
+            if matches is None:
+                state["skipped"] += 1
+                return True
+            if not matches:
+                return True
+            # 其他线程可能已占用配额，按剩余数量截断
+            remaining = max_matches - state["matches"]
+            if remaining <= 0:
+                state["truncated"] = True
+                return False
+            if len(matches) > remaining:
+                matches = matches[:remaining]
+                state["truncated"] = True
+            state["matches"] += len(matches)
+            state["files_matched"] += 1
+
+        return emit({
+            "type": "file",
+            "path": entry.path,
+            "rel_path": rel_path,
+            "matches": matches,
+        })
+
+    walker.walk(on_entry)
+
+    return {
+        "type": "done",
+        "matches": state["matches"],
+        "files_matched": state["files_matched"],
+        "files_searched": state["files_searched"],
+        "files_skipped": state["skipped"],
+        "truncated": state["truncated"],
+        "timed_out": walker.timed_out,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
@@ -0,0 +1,223 @@
+"""
+并行目录遍历服务
+使用线程池并发扫描目录，支持 .gitignore / 隐藏文件规则、取消与时间预算，
+并提供将线程中产生的结果逐条交给异步代码的桥接工具
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Optional
+
+from config import settings
+from services.ignore_rules import IgnoreRules, ALWAYS_IGNORED_DIRS
+
+# on_entry(entry, rel_path, is_dir) 返回 False 表示停止遍历，返回 SKIP 表示不进入该目录
+EntryCallback = Callable[[os.DirEntry, str, bool], object]
+SKIP = "skip"
+
+# 所有遍历共享的工作线程池：并发请求再多，遍历线程总数也不超过上限
+_walk_executor = ThreadPoolExecutor(max_workers=settings.file_walk_threads, thread_name_prefix="fs-walker")
+
+# 流式输出（搜索、打包、diff）的生产线程池，超出上限的请求排队等待
+_producer_executor = ThreadPoolExecutor(max_workers=settings.file_stream_workers,
+                                        thread_name_prefix="fs-producer")
+
+
+class ParallelWalker:
+    """
+    并行目录遍历器
+
+    多个工作线程从共享队列中取目录，用 os.scandir 扫描后把子目录放回队列。
+    工作线程来自所有遍历共享的线程池，线程池忙时部分工作线程排队，遍历仍能完成。
+    不跟随符号链接目录，因此遍历范围不会逃出根目录。
+    """
+
+    def __init__(
+        self,
+        root: str,
+        workers: int = 8,
+        show_hidden: bool = False,
+        respect_gitignore: bool = True,
+        max_depth: Optional[int] = None,
+        cancel_event: Optional[threading.Event] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.root = root
+        self.workers = max(1, min(workers, settings.file_walk_threads))
+        self.show_hidden = show_hidden
+        self.respect_gitignore = respect_gitignore
+        self.max_depth = max_depth
+        # 外部取消（如客户端断开）与遍历器自身停止（结果已满、超时）分开记录
+        self.cancel_event = cancel_event or threading.Event()
+        self._stop_event = threading.Event()
+        self.deadline = deadline  # time.monotonic() 时间点
+
+        # 遍历统计
+        self.dirs_scanned = 0
+        self.entries_seen = 0
+        self.errors = 0
+        self.timed_out = False
+        self._stats_lock = threading.Lock()
+
+    def stop(self):
+        """请求停止遍历"""
+        self._stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set() or self.cancel_event.is_set()
+
+    def walk(self, on_entry: EntryCallback):
+        """阻塞执行遍历，直到完成、被取消或超时"""
+        rules = IgnoreRules.for_root(self.root) if self.respect_gitignore else None
+        pending: queue.Queue = queue.Queue()
+        pending.put((self.root, '', rules, 0))
+
+        def worker():
+            while True:
+                item = pending.get()
+                if item is None:
+                    pending.task_done()
+                    return
+                try:
+                    if not self._check_budget():
+                        self._scan(item, on_entry, pending)
+                except Exception:
+                    with self._stats_lock:
+                        self.errors += 1
+                finally:
+                    pending.task_done()
+
+        futures = [_walk_executor.submit(worker) for _ in range(self.workers)]
+
+        # 所有目录处理完（或取消后被快速跳过）后通知工作线程退出，
+        # 还在线程池中排队的工作线程直接取消
+        pending.join()
+        for _ in futures:
+            pending.put(None)
+        running = [f for f in futures if not f.cancel()]
+        wait(running)
+
+    def _check_budget(self) -> bool:
+        """检查是否应停止，超时会记录 timed_out"""
+        if self.stopped:
+            return True
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            self.stop()
+            return True
+        return False
+
+    def _scan(self, item, on_entry: EntryCallback, pending: queue.Queue):
+        dir_path, rel_dir, rules, depth = item
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            with self._stats_lock:
+                self.errors += 1
+            return
+
+        count = 0
+        with it:
+            for entry in it:
+                if self.stopped:
+                    break
+                count += 1
+                # 超大目录中也定期检查时间预算
+                if count % 1024 == 0 and self._check_budget():
+                    break
+                name = entry.name
+                if not self.show_hidden and name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir and name in ALWAYS_IGNORED_DIRS:
+                    continue
+
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if rules is not None and rules.is_ignored(rel_path, is_dir):
+                    continue
+
+                result = on_entry(entry, rel_path, is_dir)
+                if result is False:
+                    self.stop()
+                    break
+
+                descend = is_dir and result is not SKIP
+                if descend and (self.max_depth is None or depth + 1 < self.max_depth):
+                    child_rules = rules.child(entry.path, rel_path) if rules is not None else None
+                    pending.put((entry.path, rel_path, child_rules, depth + 1))
+
+        with self._stats_lock:
+            self.dirs_scanned += 1
+            self.entries_seen += count
+
+
+_DONE = object()
+
+
+async def iterate_in_thread(
+    producer: Callable[[Callable[[object], bool], threading.Event], None],
+    max_buffered: int = 256,
+) -> AsyncIterator:
+    """
+    在后台线程中运行 producer，并以异步迭代器逐条产出结果
+
+    producer(emit, cancel_event) 通过 emit(item) 提交结果，emit 返回 False
+    表示消费方已离开（如客户端断开），producer 应尽快返回。
+    缓冲区满时 emit 会阻塞，从而把慢客户端的背压传递给生产线程。
+    """
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(max_buffered)
+    cancel_event = threading.Event()
+    error: list = []
+
+    def emit(item) -> bool:
+        while not slots.acquire(timeout=0.1):
+            if cancel_event.is_set():
+                return False
+        if cancel_event.is_set():
+            return False
+        try:
+            loop.call_soon_threadsafe(results.put_nowait, item)
+        except RuntimeError:
+            # 事件循环已关闭
+            cancel_event.set()
+            return False
+        return True
+
+    def run():
+        try:
+            producer(emit, cancel_event)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            try:
+                loop.call_soon_threadsafe(results.put_nowait, _DONE)
+            except RuntimeError:
+                pass
+
+    _producer_executor.submit(run)
+    try:
+        while True:
+            item = await results.get()
+            if item is _DONE:
+                break
+            slots.release()
+            yield item
+        if error:
+            raise error[0]
+    finally:
+        cancel_event.set()
+
+
+def shutdown():
+    """关闭遍历与生产线程池（应用退出时调用）"""
+    _producer_executor.shutdown(wait=False, cancel_futures=True)
+    _walk_executor.shutdown(wait=False, cancel_futures=True)
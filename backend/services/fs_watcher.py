@@ -0,0 +1,266 @@
+"""
+文件系统变更监听服务
+基于 Linux inotify（ctypes 直接调用 libc），将事件去抖合并后交给异步代码
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from typing import Dict, List, Optional
+
+# inotify 事件掩码
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class WatchLimitExceeded(Exception):
+    """超出单个连接允许的监听数量"""
+
+
+class InotifyWatcher:
+    """
+    单个 inotify 实例
+
+    每个 WebSocket 连接独占一个实例，连接关闭时整体释放所有监听。
+    """
+
+    def __init__(self, max_watches: int):
+        self.max_watches = max_watches
+        libc = _get_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+        self._wd_to_path: Dict[int, str] = {}
+        self._path_to_wd: Dict[str, int] = {}
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self._path_to_wd)
+
+    def add(self, path: str):
+        """添加监听（目录监听其直接子项，文件监听其自身）"""
+        if path in self._path_to_wd:
+            return
+        if len(self._path_to_wd) >= self.max_watches:
+            raise WatchLimitExceeded(f"监听数量超过上限（{self.max_watches}）")
+        wd = _get_libc().inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self._wd_to_path[wd] = path
+        self._path_to_wd[path] = wd
+
+    def remove(self, path: str):
+        wd = self._path_to_wd.pop(path, None)
+        if wd is None:
+            return
+        self._wd_to_path.pop(wd, None)
+        _get_libc().inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[tuple]:
+        """
+        读取当前可用的事件
+
+        返回 [(mask, cookie, path, watch_path)]；被删除的监听会自动清理。
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    events.append((mask, 0, None, None))
+                    continue
+                watch_path = self._wd_to_path.get(wd)
+                if watch_path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # 监听对象已被删除或卸载，内核已自动移除监听
+                    self._wd_to_path.pop(wd, None)
+                    self._path_to_wd.pop(watch_path, None)
+                    continue
+                path = os.path.join(watch_path, os.fsdecode(name)) if name else watch_path
+                events.append((mask, cookie, path, watch_path))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self._wd_to_path.clear()
+        self._path_to_wd.clear()
+
+
+def _classify(mask: int) -> Optional[str]:
+    if mask & (IN_CREATE | IN_MOVED_TO):
+        return "create"
+    if mask & (IN_DELETE | IN_DELETE_SELF | IN_MOVED_FROM | IN_MOVE_SELF):
+        return "delete"
+    if mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB):
+        return "modify"
+    return None
+
+
+def coalesce_events(raw_events: List[tuple]) -> List[dict]:
+    """
+    合并一个去抖窗口内的原始事件
+
+    - MOVED_FROM / MOVED_TO 按 cookie 配对为 move
+    - 同一路径的多个事件合并为一个（create+modify → create，
+      create+delete → 丢弃，delete+create → modify）
+    """
+    if any(path is None for _, _, path, _ in raw_events):
+        return [{"event": "overflow"}]
+
+    moved_from: Dict[int, tuple] = {}
+    for mask, cookie, path, _ in raw_events:
+        if mask & IN_MOVED_FROM and cookie:
+            moved_from[cookie] = (path, mask)
+
+    merged: Dict[str, dict] = {}
+    paired = set()
+    for mask, cookie, path, _ in raw_events:
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & IN_MOVED_TO and cookie in moved_from:
+            src = moved_from[cookie][0]
+            paired.add(cookie)
+            src_prev = merged.pop(src, None)
+            merged.pop(path, None)
+            if src_prev is not None and src_prev["event"] == "create":
+                # 窗口内新建后又被移动，对客户端而言只是新建了目标
+                merged[path] = {"event": "create", "path": path, "is_dir": is_dir}
+            else:
+                merged[path] = {"event": "move", "src": src, "path": path, "is_dir": is_dir}
+            continue
+        if mask & IN_MOVED_FROM and cookie in moved_from:
+            # 等待配对的 MOVED_TO；未配对时在下方按删除处理
+            continue
+
+        kind = _classify(mask)
+        if kind is None:
+            continue
+        prev = merged.get(path)
+        if prev is not None:
+            prev_kind = prev["event"]
+            if prev_kind == "create" and kind == "delete":
+                del merged[path]
+                continue
+            if prev_kind == "create" and kind == "modify":
+                continue
+            if prev_kind == "delete" and kind == "create":
+                kind = "modify"
+            del merged[path]
+        merged[path] = {"event": kind, "path": path, "is_dir": is_dir}
+
+    for cookie, (src, mask) in moved_from.items():
+        if cookie not in paired:
+            merged.pop(src, None)
+            merged[src] = {"event": "delete", "path": src, "is_dir": bool(mask & IN_ISDIR)}
+
+    return list(merged.values())
+
+
+class WatchSession:
+    """
+    异步监听会话
+
+    在事件循环上注册 inotify fd 的可读回调，收到事件后等待 debounce 秒
+    再合并，合并结果放入队列，由 get() 取出。
+    """
+
+    def __init__(self, max_watches: int, debounce: float = 0.2):
+        self.watcher = InotifyWatcher(max_watches)
+        self.debounce = debounce
+        self._loop = asyncio.get_running_loop()
+        self._pending: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._loop.add_reader(self.watcher.fd, self._on_readable)
+
+    def add(self, path: str):
+        self.watcher.add(path)
+
+    def remove(self, path: str):
+        self.watcher.remove(path)
+
+    @property
+    def paths(self) -> List[str]:
+        return self.watcher.paths
+
+    def _on_readable(self):
+        try:
+            self._pending.extend(self.watcher.read_events())
+        except OSError:
+            return
+        if self._pending and self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.debounce, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        raw, self._pending = self._pending, []
+        events = coalesce_events(raw)
+        if events:
+            self._queue.put_nowait(events)
+
+    async def get(self) -> List[dict]:
+        """等待下一批合并后的事件"""
+        return await self._queue.get()
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.watcher.fd >= 0:
+            self._loop.remove_reader(self.watcher.fd)
+        self.watcher.close()
@@ -0,0 +1,310 @@
+"""
+工作目录 git 服务
+查询任务工作目录的 git 状态与 diff，结果按 索引 / HEAD / 工作区 的修改时间缓存
+"""
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 只读查询不获取可选锁，避免与任务中正在执行的 git 命令争用 index.lock
+_GIT_ENV = dict(os.environ, GIT_OPTIONAL_LOCKS="0", GIT_TERMINAL_PROMPT="0", LC_ALL="C")
+
+_READ_SIZE = 64 * 1024
+
+# 缓存的 diff 条目数上限
+MAX_DIFF_ENTRIES = 128
+
+# 流式 diff 中途 git 失败时追加在输出末尾的标记行（后接错误信息），客户端据此判断 diff 不完整
+DIFF_ERROR_MARKER = b"\n### git diff failed: "
+
+
+class GitError(Exception):
+    """git 命令执行失败"""
+
+
+class NotAGitRepository(GitError):
+    """目录不在 git 仓库中"""
+
+
+def run_git(cwd: str, *args: str) -> bytes:
+    """执行 git 命令并返回标准输出，失败时抛出 GitError"""
+    try:
+        result = subprocess.run(
+            ["git", "-C", cwd, *args],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            env=_GIT_ENV,
+            timeout=settings.git_command_timeout,
+        )
+    except FileNotFoundError:
+        raise GitError("未安装 git")
+    except subprocess.TimeoutExpired:
+        raise GitError("git 命令执行超时")
+    if result.returncode != 0:
+        raise GitError(result.stderr.decode("utf-8", "replace").strip() or "git 命令执行失败")
+    return result.stdout
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def parse_status(output: bytes) -> dict:
+    """解析 git status --porcelain=v2 --branch -z 的输出"""
+    status = {
+        "commit": None,
+        "branch": None,
+        "upstream": None,
+        "ahead": 0,
+        "behind": 0,
+        "files": [],
+    }
+    tokens = output.decode("utf-8", "surrogateescape").split("\0")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if not token:
+            continue
+        if token.startswith("# "):
+            key, _, value = token[2:].partition(" ")
+            if key == "branch.oid":
+                status["commit"] = None if value == "(initial)" else value
+            elif key == "branch.head":
+                status["branch"] = None if value == "(detached)" else value
+            elif key == "branch.upstream":
+                status["upstream"] = value
+            elif key == "branch.ab":
+                ahead, behind = value.split()
+                status["ahead"] = int(ahead)
+                status["behind"] = -int(behind)
+            continue
+
+        kind = token[0]
+        if kind == "1":
+            fields = token.split(" ", 8)
+            status["files"].append(_file_entry("modified", fields[1], fields[8]))
+        elif kind == "2":
+            fields = token.split(" ", 9)
+            entry = _file_entry("renamed", fields[1], fields[9])
+            # 重命名记录后紧跟原路径
+            entry["orig_path"] = tokens[i]
+            i += 1
+            status["files"].append(entry)
+        elif kind == "u":
+            fields = token.split(" ", 10)
+            status["files"].append(_file_entry("unmerged", fields[1], fields[10]))
+        elif kind == "?":
+            status["files"].append(_file_entry("untracked", "??", token[2:]))
+    status["clean"] = not status["files"]
+    return status
+
+
+def _file_entry(kind: str, xy: str, path: str) -> dict:
+    """X 为暂存区状态，Y 为工作区状态，'.' 表示未变化"""
+    return {"path": path, "kind": kind, "index": xy[0], "worktree": xy[1]}
+
+
+def normalize_repo_path(path: str) -> str:
+    """校验并规范化仓库内的相对路径"""
+    if os.path.isabs(path):
+        raise ValueError("路径必须是相对仓库根目录的路径")
+    path = os.path.normpath(path)
+    if path == ".." or path.startswith("../"):
+        raise ValueError("路径超出仓库范围")
+    return "" if path == "." else path
+
+
+class GitService:
+    """
+    git 查询服务
+
+    缓存以仓库指纹校验：索引、HEAD 及其指向的引用、packed-refs、仓库根目录，
+    以及上次结果中已变更文件的修改时间。只修改原本干净的文件不会改变上述任何一项，
+    因此缓存另有 TTL 作为过期上限。
+    """
+
+    def __init__(self, ttl: float, diff_cache_max_bytes: int):
+        self.ttl = ttl
+        self.diff_cache_max_bytes = diff_cache_max_bytes
+        self._repos: Dict[str, Tuple[str, str, str]] = {}
+        self._status: Dict[str, Tuple[tuple, float, dict]] = {}
+        self._diffs: "OrderedDict[tuple, Tuple[tuple, float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def repo(self, work_dir: str) -> Tuple[str, str, str]:
+        """返回 (git_dir, common_dir, 仓库根目录)"""
+        with self._lock:
+            cached = self._repos.get(work_dir)
+        if cached is not None and os.path.isdir(cached[0]):
+            return cached
+        if not os.path.isdir(work_dir):
+            raise NotAGitRepository("工作目录不存在")
+        try:
+            output = run_git(work_dir, "rev-parse", "--absolute-git-dir",
+                             "--git-common-dir", "--show-toplevel")
+        except GitError:
+            raise NotAGitRepository("工作目录不在 git 仓库中")
+        git_dir, common_dir, top_level = output.decode("utf-8", "surrogateescape").splitlines()[:3]
+        common_dir = os.path.normpath(os.path.join(work_dir, common_dir))
+        info = (git_dir, common_dir, top_level)
+        with self._lock:
+            self._repos[work_dir] = info
+        return info
+
+    def _fingerprint(self, work_dir: str, paths: Iterable[str] = ()) -> tuple:
+        git_dir, common_dir, top_level = self.repo(work_dir)
+        head_path = os.path.join(git_dir, "HEAD")
+        ref_mtime = None
+        try:
+            with open(head_path, "r") as f:
+                head = f.read().strip()
+            if head.startswith("ref: "):
+                ref_mtime = _mtime(os.path.join(common_dir, head[5:]))
+        except OSError:
+            head = None
+        return (
+            head,
+            ref_mtime,
+            _mtime(head_path),
+            _mtime(os.path.join(git_dir, "index")),
+            _mtime(os.path.join(common_dir, "packed-refs")),
+            _mtime(top_level),
+        ) + tuple(_mtime(os.path.join(top_level, p)) for p in paths)
+
+    def status(self, work_dir: str) -> dict:
+        """获取工作目录所在仓库的状态（阻塞，应在线程池中调用）"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._status.get(work_dir)
+        if cached is not None:
+            fingerprint, created, result = cached
+            changed = [f["path"] for f in result["files"]]
+            if now - created < self.ttl and self._fingerprint(work_dir, changed) == fingerprint:
+                return result
+
+        _, _, top_level = self.repo(work_dir)
+        # 先取指纹再执行命令：命令执行期间的修改会让下次校验失败，而不是被缓存掩盖
+        base = self._fingerprint(work_dir)
+        output = run_git(top_level, "status", "--porcelain=v2", "--branch", "-z")
+        result = parse_status(output)
+        result["root"] = top_level
+        changed = [f["path"] for f in result["files"]]
+        fingerprint = base + tuple(_mtime(os.path.join(top_level, p)) for p in changed)
+        with self._lock:
+            self._status[work_dir] = (fingerprint, now, result)
+        return result
+
+    def _diff_args(self, status: dict, path: str, staged: bool, context: int) -> List[str]:
+        untracked = any(f["path"] == path and f["kind"] == "untracked" for f in status["files"])
+        if path and untracked and not staged:
+            # 未跟踪文件与空文件比较，显示为新增
+            return ["diff", "--no-color", "--no-ext-diff", "--no-index",
+                    f"-U{context}", "--", os.devnull, path]
+        args = ["diff", "--no-color", "--no-ext-diff", "--find-renames", f"-U{context}"]
+        if staged:
+            args.append("--cached")
+        args.append("--")
+        if path:
+            args.append(path)
+        return args
+
+    def _diff_key(self, work_dir: str, status: dict, path: str,
+                  staged: bool, context: int) -> Tuple[tuple, tuple]:
+        paths = [path] if path else [f["path"] for f in status["files"]]
+        return (work_dir, path, staged, context), self._fingerprint(work_dir, paths)
+
+    def cached_diff(self, work_dir: str, path: str, staged: bool, context: int) -> Optional[bytes]:
+        """命中缓存时返回 diff 内容（阻塞，应在线程池中调用）"""
+        status = self.status(work_dir)
+        key, fingerprint = self._diff_key(work_dir, status, path, staged, context)
+        with self._lock:
+            cached = self._diffs.get(key)
+            if cached is None:
+                return None
+            cached_fingerprint, created, data = cached
+            if cached_fingerprint != fingerprint or time.monotonic() - created >= self.ttl:
+                del self._diffs[key]
+                return None
+            self._diffs.move_to_end(key)
+            return data
+
+    def diff_producer(self, work_dir: str, path: str, staged: bool,
+                      context: int) -> Callable[[Callable[[bytes], bool], threading.Event], None]:
+        """
+        返回流式输出 diff 的 producer（配合 iterate_in_thread 使用）
+
+        输出不超过缓存上限且完整读取时写入缓存。
+        """
+        def producer(emit: Callable[[bytes], bool], cancel_event: threading.Event):
+            status = self.status(work_dir)
+            key, fingerprint = self._diff_key(work_dir, status, path, staged, context)
+            created = time.monotonic()
+            args = self._diff_args(status, path, staged, context)
+            # 错误输出写入临时文件，避免管道写满阻塞 git
+            stderr = tempfile.TemporaryFile()
+            proc = subprocess.Popen(
+                ["git", "-C", status["root"], *args],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                env=_GIT_ENV,
+            )
+            chunks: Optional[List[bytes]] = []
+            size = 0
+            complete = False
+            try:
+                while not cancel_event.is_set():
+                    chunk = proc.stdout.read1(_READ_SIZE)
+                    if not chunk:
+                        complete = True
+                        break
+                    if chunks is not None:
+                        size += len(chunk)
+                        if size <= self.diff_cache_max_bytes:
+                            chunks.append(chunk)
+                        else:
+                            chunks = None
+                    if not emit(chunk):
+                        break
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                proc.wait()
+                proc.stdout.close()
+                stderr.seek(0)
+                message = stderr.read().decode("utf-8", "replace").strip()
+                stderr.close()
+
+            # --no-index 有差异时退出码为 1
+            if complete and proc.returncode not in ((0, 1) if "--no-index" in args else (0,)):
+                message = message or f"退出码 {proc.returncode}"
+                logger.warning(f"git diff 失败 ({status['root']}): {message}")
+                # 响应头已经发出，只能在输出末尾标记 diff 不完整
+                emit(DIFF_ERROR_MARKER + message.encode("utf-8") + b"\n")
+                return
+
+            if complete and chunks is not None:
+                with self._lock:
+                    self._diffs[key] = (fingerprint, created, b"".join(chunks))
+                    self._diffs.move_to_end(key)
+                    while len(self._diffs) > MAX_DIFF_ENTRIES:
+                        self._diffs.popitem(last=False)
+
+        return producer
+
+
+# 全局单例
+git_service = GitService(settings.git_cache_ttl, settings.git_diff_cache_max_kb * 1024)
@@ -0,0 +1,70 @@
+"""
+HTTP 条件请求
+根据 ETag / Last-Modified 处理 If-None-Match / If-Modified-Since，未变化时返回 304
+"""
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable, Mapping, Optional
+
+from fastapi.responses import Response
+
+
+def stat_etag(stat: os.stat_result, weak: bool = False) -> str:
+    """由 inode、大小、修改时间生成 ETag"""
+    tag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    return f"W/{tag}" if weak else tag
+
+
+def digest_etag(parts: Iterable, weak: bool = True) -> str:
+    """由一组值的摘要生成 ETag（用于目录列表等组合内容）"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    tag = f'"{digest.hexdigest()[:20]}"'
+    return f"W/{tag}" if weak else tag
+
+
+def _opaque(etag: str) -> str:
+    """去掉弱标记，用于弱比较"""
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(headers: Optional[Mapping[str, str]], etag: str,
+                    last_modified: Optional[float] = None) -> bool:
+    """
+    判断客户端缓存是否仍然有效
+
+    If-None-Match 存在时只按 ETag 弱比较（RFC 9110），否则再看 If-Modified-Since。
+    """
+    if not headers:
+        return False
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        target = _opaque(etag)
+        return any(_opaque(tag.strip()) == target for tag in if_none_match.split(","))
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP 日期精度为秒
+        return int(last_modified) <= since
+    return False
+
+
+def cache_headers(etag: str, last_modified: Optional[float] = None) -> dict:
+    """响应中携带的校验头；no-cache 要求客户端每次使用前先重新验证"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: Optional[float] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
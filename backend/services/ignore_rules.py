@@ -0,0 +1,165 @@
+"""
+忽略规则服务
+解析 .gitignore 并判断路径是否应被忽略（用于文件搜索、打包下载等遍历场景）
+"""
+import os
+import re
+from typing import List, Optional
+
+# 无论是否启用 .gitignore，遍历时都跳过的目录
+ALWAYS_IGNORED_DIRS = {'.git', '.hg', '.svn'}
+
+
+def translate_glob(pattern: str) -> str:
+    """
+    将 gitignore 风格的 glob 转换为正则表达式
+
+    - `*` 匹配除 `/` 外的任意字符
+    - `?` 匹配除 `/` 外的单个字符
+    - `**/` 匹配零或多级目录，`/**` 匹配其下所有内容
+    - `[...]` 字符集原样保留
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 3] == '**/':
+                parts.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**':
+                parts.append('.*')
+                i += 2
+                continue
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+class IgnorePattern:
+    """单条 gitignore 规则"""
+
+    __slots__ = ('negate', 'dir_only', 'anchored', 'regex')
+
+    def __init__(self, line: str):
+        self.negate = line.startswith('!')
+        if self.negate:
+            line = line[1:]
+        self.dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # 含有 / 的规则相对于 .gitignore 所在目录锚定，否则匹配任意层级的文件名
+        self.anchored = '/' in line
+        line = line.lstrip('/')
+        self.regex = re.compile(translate_glob(line) + r'\Z')
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return self.regex.match(rel_path) is not None
+        return self.regex.match(name) is not None
+
+
+def parse_ignore_lines(lines) -> List[IgnorePattern]:
+    """解析 .gitignore 内容为规则列表"""
+    patterns = []
+    for raw in lines:
+        line = raw.rstrip('\n').rstrip('\r')
+        # 未转义的行尾空格无意义
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('\\#') or line.startswith('\\!'):
+            line = line[1:]
+        try:
+            patterns.append(IgnorePattern(line))
+        except re.error:
+            continue
+    return patterns
+
+
+class IgnoreRules:
+    """
+    分层的忽略规则
+
+    每个目录的 .gitignore 生成一个子节点，判断时从根到叶依次匹配，
+    后匹配的规则覆盖先匹配的规则（与 git 行为一致）。
+    """
+
+    __slots__ = ('parent', 'base', 'patterns')
+
+    def __init__(self, base: str = '', patterns: Optional[List[IgnorePattern]] = None,
+                 parent: Optional['IgnoreRules'] = None):
+        self.parent = parent
+        self.base = base  # 相对遍历根目录的路径，根目录为 ''
+        self.patterns = patterns or []
+
+    @classmethod
+    def for_root(cls, root: str) -> 'IgnoreRules':
+        """加载根目录的 .gitignore 与 .git/info/exclude"""
+        patterns = []
+        for name in (os.path.join('.git', 'info', 'exclude'), '.gitignore'):
+            patterns.extend(_read_ignore_file(os.path.join(root, name)))
+        return cls('', patterns)
+
+    def child(self, dir_path: str, rel_dir: str) -> 'IgnoreRules':
+        """进入子目录：若存在 .gitignore 则派生新节点，否则复用当前节点"""
+        patterns = _read_ignore_file(os.path.join(dir_path, '.gitignore'))
+        if not patterns:
+            return self
+        return IgnoreRules(rel_dir, patterns, self)
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """判断相对根目录的路径是否被忽略"""
+        name = rel_path.rsplit('/', 1)[-1]
+        if is_dir and name in ALWAYS_IGNORED_DIRS:
+            return True
+
+        chain: List[IgnoreRules] = []
+        node = self
+        while node is not None:
+            chain.append(node)
+            node = node.parent
+
+        ignored = False
+        for node in reversed(chain):
+            if node.base:
+                prefix = node.base + '/'
+                if not rel_path.startswith(prefix):
+                    continue
+                local = rel_path[len(prefix):]
+            else:
+                local = rel_path
+            for pattern in node.patterns:
+                if pattern.matches(local, name, is_dir):
+                    ignored = not pattern.negate
+        return ignored
+
+
+def _read_ignore_file(path: str) -> List[IgnorePattern]:
+    """读取忽略文件，不存在或不可读时返回空列表"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return parse_ignore_lines(f)
+    except (OSError, UnicodeError):
+        return []
+
@@ -0,0 +1,282 @@
+"""
+后台任务服务
+耗时的文件操作（递归删除、复制、移动、打包、统计大小）提交后立即返回任务 ID，
+在工作线程池中执行，可查询进度与取消
+"""
+import errno
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from services.archive_service import write_archive
+from services.du_service import du_cache
+from services.file_ops import is_special_file, remove_tree
+
+JOB_TYPES = ("delete", "copy", "move", "archive", "du")
+
+# 已结束任务的保留时长（秒）
+FINISHED_JOB_TTL = 3600
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+
+class Job:
+    """单个后台任务"""
+
+    def __init__(self, job_type: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.params = params
+        self.status = "pending"  # pending, running, completed, failed, cancelled
+        self.items_done = 0
+        self.bytes_done = 0
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def progress(self, items: int, nbytes: int):
+        """更新进度，已请求取消时抛出 JobCancelled 中断执行"""
+        self.items_done = items
+        self.bytes_done = nbytes
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "params": self.params,
+            "status": self.status,
+            "items_done": self.items_done,
+            "bytes_done": self.bytes_done,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _run_delete(job: Job) -> dict:
+    path = job.params["path"]
+    if os.path.isdir(path) and not os.path.islink(path):
+        if not remove_tree(path, job.cancel_event, job.progress):
+            raise JobCancelled()
+    else:
+        size = os.lstat(path).st_size
+        os.remove(path)
+        job.progress(1, size)
+    return {"path": path, "items": job.items_done, "bytes": job.bytes_done}
+
+
+# 结果中列出的跳过文件数上限
+MAX_REPORTED_SKIPPED = 100
+
+
+def _copy_tree(src: str, dest: str, job: Job) -> List[str]:
+    """逐个文件复制目录，报告进度并响应取消；返回跳过的特殊文件（FIFO、设备文件、socket）"""
+    items = 0
+    nbytes = 0
+    skipped: List[str] = []
+
+    def copy_file(s: str, d: str):
+        nonlocal items, nbytes
+        if os.path.islink(s):
+            os.symlink(os.readlink(s), d)
+        elif is_special_file(s):
+            # 读取设备文件可能永不结束，FIFO 会让 copy2 报错，均不复制
+            skipped.append(s)
+            return
+        else:
+            shutil.copy2(s, d)
+            nbytes += os.path.getsize(d)
+        items += 1
+        job.progress(items, nbytes)
+
+    if not os.path.isdir(src) or os.path.islink(src):
+        copy_file(src, dest)
+        return skipped
+
+    for dir_path, dir_names, file_names in os.walk(src):
+        rel = os.path.relpath(dir_path, src)
+        target_dir = dest if rel == "." else os.path.join(dest, rel)
+        os.makedirs(target_dir, exist_ok=rel != ".")
+        shutil.copystat(dir_path, target_dir)
+        items += 1
+        job.progress(items, nbytes)
+        for name in list(dir_names):
+            s = os.path.join(dir_path, name)
+            if os.path.islink(s):
+                # 不进入符号链接目录，按链接复制
+                dir_names.remove(name)
+                copy_file(s, os.path.join(target_dir, name))
+        for name in file_names:
+            copy_file(os.path.join(dir_path, name), os.path.join(target_dir, name))
+    return skipped
+
+
+def _skipped_result(skipped: List[str]) -> dict:
+    return {"skipped": len(skipped), "skipped_paths": skipped[:MAX_REPORTED_SKIPPED]}
+
+
+def _run_copy(job: Job) -> dict:
+    src, dest = job.params["path"], job.params["dest"]
+    skipped = _copy_tree(src, dest, job)
+    return {"path": src, "dest": dest, "items": job.items_done, "bytes": job.bytes_done,
+            **_skipped_result(skipped)}
+
+
+def _run_move(job: Job) -> dict:
+    src, dest = job.params["path"], job.params["dest"]
+    try:
+        # 同一文件系统内直接重命名
+        os.rename(src, dest)
+        job.progress(1, 0)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # 跨文件系统：退化为复制后删除
+        skipped = _copy_tree(src, dest, job)
+        if skipped:
+            # 有特殊文件未复制，保留源路径，避免删除未移动的内容
+            return {"path": src, "dest": dest, "items": job.items_done, "bytes": job.bytes_done,
+                    "source_kept": True, **_skipped_result(skipped)}
+        if os.path.isdir(src) and not os.path.islink(src):
+            remove_tree(src)
+        else:
+            os.remove(src)
+    return {"path": src, "dest": dest, "items": job.items_done, "bytes": job.bytes_done}
+
+
+def _run_archive(job: Job) -> dict:
+    src, dest = job.params["path"], job.params["dest"]
+    fmt = job.params.get("format", "tar.gz")
+    tmp = f"{dest}.{job.id}.tmp"
+    written = 0
+    try:
+        with open(tmp, "wb") as f:
+            def emit(chunk: bytes) -> bool:
+                nonlocal written
+                f.write(chunk)
+                written += len(chunk)
+                job.bytes_done = written
+                return not job.cancel_event.is_set()
+
+            write_archive(src, fmt, emit, job.cancel_event,
+                          exclude=job.params.get("exclude"),
+                          respect_gitignore=job.params.get("respect_gitignore", False))
+        if job.cancel_event.is_set():
+            raise JobCancelled()
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return {"path": src, "dest": dest, "bytes": written}
+
+
+def _run_du(job: Job) -> dict:
+    # 与 /du 接口共用按目录 mtime 的缓存，只重新扫描变化过的目录
+    result = du_cache.compute(job.params["path"], cancel_event=job.cancel_event, progress=job.progress)
+    if result is None:
+        raise JobCancelled()
+    job.progress(result["files"] + result["dirs"], result["size"])
+    return {"path": result["path"], "size": result["size"], "items": result["files"] + result["dirs"]}
+
+
+_RUNNERS: Dict[str, Callable[[Job], dict]] = {
+    "delete": _run_delete,
+    "copy": _run_copy,
+    "move": _run_move,
+    "archive": _run_archive,
+    "du": _run_du,
+}
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_type: str, params: dict) -> Job:
+        """提交任务，立即返回"""
+        if job_type not in _RUNNERS:
+            raise ValueError(f"不支持的任务类型: {job_type}")
+        self.cleanup_finished()
+        job = Job(job_type, params)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_event.set()
+        return job
+
+    def cleanup_finished(self):
+        """清理结束较久的任务记录"""
+        expire_before = time.time() - FINISHED_JOB_TTL
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values()
+                           if j.finished and j.finished_at is not None
+                           and j.finished_at < expire_before]:
+                del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            job.finished_at = time.time()
+            job.status = "cancelled"
+            return
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            job.result = _RUNNERS[job.type](job)
+            status = "completed"
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status = "failed"
+            job.error = str(e)
+        # 先记录结束时间再更新状态，其他线程看到结束状态时 finished_at 一定已经设置
+        job.finished_at = time.time()
+        job.status = status
+
+    def shutdown(self):
+        """取消所有未完成的任务并关闭线程池"""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局单例
+job_manager = JobManager(settings.job_workers)
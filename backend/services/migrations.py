@@ -0,0 +1,61 @@
+"""
+数据库迁移
+create_tables 只创建缺失的表，已有数据库文件中的表结构变更（如新增索引）由这里的迁移完成。
+
+迁移按版本号顺序执行，已执行的版本记录在 schema_migrations 表中；
+每个迁移都应是幂等的，新建的数据库上 create_all 已经建好的对象会被跳过
+"""
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+
+from services.database import Base
+
+logger = logging.getLogger(__name__)
+
+_migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _create_indexes(conn: Connection, table_name: str, index_names: List[str]):
+    """按模型中的定义创建索引（已存在时跳过）"""
+    table = Base.metadata.tables[table_name]
+    indexes = {index.name: index for index in table.indexes}
+    for name in index_names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+def _add_user_indexes(conn: Connection):
+    _create_indexes(conn, "tasks", ["ix_tasks_user_created", "ix_tasks_user_status_created"])
+    _create_indexes(conn, "quick_projects", ["ix_quick_projects_user_id"])
+
+
+# (版本号, 说明, 迁移函数)，只能追加，不能修改已发布的迁移
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "任务与快速启动项目的按用户查询索引", _add_user_indexes),
+]
+
+
+def run_migrations(engine: Engine):
+    """执行尚未执行的迁移，每个迁移在单独的事务中完成"""
+    _migration_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"执行数据库迁移 {version}: {description}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
@@ -0,0 +1,219 @@
+"""
+监听端口发现
+从 tmux 会话各窗格的进程出发遍历进程树，通过 /proc/<pid>/fd 中的 socket inode
+与 /proc/net/tcp{,6} 中处于 LISTEN 状态的套接字对应，得到任务启动的服务监听的端口。
+
+结果短时缓存；进程的 socket inode 按进程记录，只有出现尚未归属的监听套接字时
+才重新扫描 fd，常态下刷新只需读取 /proc/net/tcp 与各进程的 stat
+"""
+import os
+import socket
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import settings
+
+PROC = "/proc"
+
+# /proc/net/tcp 中 LISTEN 状态的编码
+_TCP_LISTEN = "0A"
+
+
+def _decode_address(hex_addr: str, ipv6: bool) -> str:
+    """解码 /proc/net/tcp 中的地址（按 32 位小端存放）"""
+    raw = bytes.fromhex(hex_addr)
+    raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return socket.inet_ntop(socket.AF_INET6 if ipv6 else socket.AF_INET, raw)
+
+
+def read_listening_sockets(proc: str = PROC) -> Dict[int, Tuple[str, int]]:
+    """读取处于 LISTEN 状态的 TCP 套接字，返回 {inode: (地址, 端口)}"""
+    listeners: Dict[int, Tuple[str, int]] = {}
+    for name, ipv6 in (("tcp", False), ("tcp6", True)):
+        try:
+            with open(os.path.join(proc, "net", name)) as f:
+                next(f, None)  # 表头
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 10 or fields[3] != _TCP_LISTEN:
+                        continue
+                    inode = int(fields[9])
+                    if inode == 0:
+                        continue
+                    addr, _, port = fields[1].partition(":")
+                    listeners[inode] = (_decode_address(addr, ipv6), int(port, 16))
+        except (OSError, ValueError):
+            continue
+    return listeners
+
+
+def read_process_table(proc: str = PROC) -> Dict[int, Tuple[int, int, str]]:
+    """读取所有进程，返回 {pid: (ppid, 启动时间, 命令名)}"""
+    table: Dict[int, Tuple[int, int, str]] = {}
+    for entry in os.listdir(proc):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, entry, "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 命令名可能包含空格和括号，以最后一个 ')' 分隔
+        lparen, rparen = stat.find("("), stat.rfind(")")
+        fields = stat[rparen + 2:].split()
+        try:
+            table[int(entry)] = (int(fields[1]), int(fields[19]), stat[lparen + 1:rparen])
+        except (IndexError, ValueError):
+            continue
+    return table
+
+
+def read_socket_inodes(pid: int, proc: str = PROC) -> Set[int]:
+    """读取进程打开的 socket inode，无权限或进程已退出时返回空集合"""
+    inodes: Set[int] = set()
+    fd_dir = os.path.join(proc, str(pid), "fd")
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return inodes
+    for fd in fds:
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            try:
+                inodes.add(int(target[8:-1]))
+            except ValueError:
+                continue
+    return inodes
+
+
+def is_proxyable(address: str) -> bool:
+    """代理通过 127.0.0.1 连接上游，只有监听在回环或全部地址上的端口可以代理"""
+    return address in ("0.0.0.0", "::", "::ffff:127.0.0.1") or address.startswith("127.")
+
+
+class PortDiscovery:
+    """按进程树查找监听端口（结果短时缓存）"""
+
+    def __init__(self, ttl: float, proc: str = PROC):
+        self.ttl = ttl
+        self.proc = proc
+        self._lock = threading.Lock()
+        self._snapshot_at = 0.0
+        self._listeners: Dict[int, Tuple[str, int]] = {}
+        self._processes: Dict[int, Tuple[int, int, str]] = {}
+        self._children: Dict[int, List[int]] = {}
+        # (pid, 启动时间) -> (扫描时的代数, socket inode)；pid 被复用时启动时间不同
+        self._sockets: Dict[Tuple[int, int], Tuple[int, Set[int]]] = {}
+        # 出现新的监听套接字时递增，已扫描的进程需要重新扫描
+        self._generation = 0
+        self._sessions: Dict[str, Tuple[float, List[dict]]] = {}
+
+    def _refresh(self):
+        """刷新监听套接字与进程表快照（调用方持有锁）"""
+        now = time.monotonic()
+        if now - self._snapshot_at < self.ttl:
+            return
+        listeners = read_listening_sockets(self.proc)
+        processes = read_process_table(self.proc)
+        if set(listeners) - set(self._listeners):
+            self._generation += 1
+        children: Dict[int, List[int]] = {}
+        for pid, (ppid, _, _) in processes.items():
+            children.setdefault(ppid, []).append(pid)
+        alive = {(pid, info[1]) for pid, info in processes.items()}
+        for key in [key for key in self._sockets if key not in alive]:
+            del self._sockets[key]
+        self._listeners = listeners
+        self._processes = processes
+        self._children = children
+        self._snapshot_at = now
+
+    def _descendants(self, root_pids: Iterable[int]) -> List[int]:
+        """root_pids 及其所有子孙进程（调用方持有锁）"""
+        result: List[int] = []
+        seen: Set[int] = set()
+        stack = [pid for pid in root_pids if pid in self._processes]
+        while stack:
+            pid = stack.pop()
+            if pid in seen:
+                continue
+            seen.add(pid)
+            result.append(pid)
+            stack.extend(self._children.get(pid, ()))
+        return result
+
+    def _process_sockets(self, pid: int) -> Set[int]:
+        """进程的 socket inode，只在进程是新出现的或出现了新监听套接字时重新扫描（调用方持有锁）"""
+        key = (pid, self._processes[pid][1])
+        cached = self._sockets.get(key)
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
+        inodes = read_socket_inodes(pid, self.proc)
+        self._sockets[key] = (self._generation, inodes)
+        return inodes
+
+    def ports_for_pids(self, root_pids: Iterable[int]) -> List[dict]:
+        """root_pids 进程树中各进程监听的端口（阻塞，应在线程池中调用）"""
+        with self._lock:
+            self._refresh()
+            ports: Dict[int, dict] = {}
+            for pid in self._descendants(root_pids):
+                for inode in self._process_sockets(pid):
+                    listener = self._listeners.get(inode)
+                    if listener is None:
+                        continue
+                    address, port = listener
+                    item = ports.get(port)
+                    if item is None:
+                        item = ports[port] = {
+                            "port": port,
+                            "addresses": [],
+                            "pid": pid,
+                            "command": self._processes[pid][2],
+                            "proxyable": False,
+                        }
+                    if address not in item["addresses"]:
+                        item["addresses"].append(address)
+                    item["proxyable"] = item["proxyable"] or is_proxyable(address)
+            return [ports[port] for port in sorted(ports)]
+
+    def session_ports(self, session_name: str) -> List[dict]:
+        """tmux 会话中启动的服务监听的端口（阻塞，应在线程池中调用）"""
+        cached = self._sessions.get(session_name)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        from platform_utils import get_terminal_service
+
+        terminal = get_terminal_service()
+        pane_pids = terminal.get_pane_pids(session_name)
+        ports = self.ports_for_pids(pane_pids) if pane_pids else []
+        now = time.monotonic()
+        with self._lock:
+            for name in [name for name, (at, _) in self._sessions.items() if now - at >= self.ttl]:
+                del self._sessions[name]
+            self._sessions[session_name] = (now, ports)
+        return ports
+
+    def is_listening(self, port: int) -> Optional[bool]:
+        """
+        本机是否有服务在回环或全部地址上监听该端口，无法读取 /proc 时返回 None
+
+        先查缓存的快照，快照中没有该端口时再读取一次 /proc/net/tcp{,6}，
+        刚启动的服务不会被误判（阻塞，应在线程池中调用）
+        """
+        if not os.path.exists(os.path.join(self.proc, "net", "tcp")):
+            return None
+        with self._lock:
+            self._refresh()
+            if any(p == port and is_proxyable(addr) for addr, p in self._listeners.values()):
+                return True
+        listeners = read_listening_sockets(self.proc).values()
+        return any(p == port and is_proxyable(addr) for addr, p in listeners)
+
+# 全局单例
+port_discovery = PortDiscovery(ttl=settings.port_discovery_ttl)
@@ -0,0 +1,371 @@
+"""
+反向代理静态资源缓存
+按上游端口隔离，遵循 Cache-Control / ETag / Last-Modified，过期后向上游发起条件请求重新验证；
+响应体存放在内存，超出内存容量的部分落到磁盘，两级均按字节数做 LRU 淘汰
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from config import settings
+
+# 不转存的响应头（由代理重新生成或与单次连接相关）
+_NOT_STORED_HEADERS = {"date", "age", "connection", "keep-alive", "transfer-encoding", "set-cookie"}
+
+# 磁盘缓存文件名（sha1 十六进制）
+_ENTRY_NAME = re.compile(r"[0-9a-f]{40}")
+
+# 启发式新鲜期上限（秒）：上游只给 Last-Modified 时，取距修改时间的 10%
+_HEURISTIC_MAX = 24 * 3600
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """解析 Cache-Control 头为 {指令: 值}"""
+    directives: Dict[str, Optional[str]] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, sep, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """解析 HTTP 日期为时间戳，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _int_directive(directives: dict, name: str) -> Optional[int]:
+    try:
+        return int(directives[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str], now: float,
+                       with_cookie: bool = False) -> Optional[float]:
+    """
+    按共享缓存的规则计算响应的新鲜期（秒）
+
+    缓存由所有用户共享，private 响应不缓存；请求带 Cookie 时，
+    只有显式标记 public 或给出 s-maxage 的响应才缓存。
+    返回 None 表示不可缓存；返回 0 表示可以缓存但每次使用前都要重新验证。
+    """
+    cc = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in cc or "private" in cc or "set-cookie" in headers \
+            or headers.get("vary", "").strip() == "*":
+        return None
+    if with_cookie and "public" not in cc and "s-maxage" not in cc:
+        return None
+    validators = "etag" in headers or "last-modified" in headers
+
+    if "no-cache" in cc:
+        return 0 if validators else None
+    # 共享缓存优先使用 s-maxage
+    age = _int_directive(cc, "s-maxage")
+    if age is None:
+        age = _int_directive(cc, "max-age")
+    if age is not None:
+        lifetime = age
+    elif "expires" in headers:
+        expires = parse_http_date(headers.get("expires"))
+        date = parse_http_date(headers.get("date")) or now
+        lifetime = expires - date if expires is not None else 0
+    else:
+        last_modified = parse_http_date(headers.get("last-modified"))
+        if last_modified is not None:
+            lifetime = min((now - last_modified) * 0.1, _HEURISTIC_MAX)
+        elif validators:
+            lifetime = 0
+        else:
+            return None
+    try:
+        lifetime -= int(headers.get("age", 0))
+    except ValueError:
+        pass
+    if lifetime <= 0 and not validators:
+        return None
+    return max(lifetime, 0)
+
+
+class CacheEntry:
+    """一个已缓存的响应"""
+
+    def __init__(self, key: tuple, vary: Dict[str, str], headers: List[Tuple[str, str]],
+                 size: int, fresh_until: float):
+        self.key = key
+        self.vary = vary
+        self.headers = headers
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stored_at = time.time()
+        self.body: Optional[bytes] = None
+        self.disk_path: Optional[str] = None
+        self.hits = 0
+
+    def header(self, name: str) -> Optional[str]:
+        for key, value in self.headers:
+            if key == name:
+                return value
+        return None
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.header("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.header("last-modified")
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+
+class ProxyCache:
+    """代理缓存（内存 + 磁盘两级，按端口隔离）"""
+
+    def __init__(self, enabled: bool, memory_bytes: int, disk_bytes: int,
+                 cache_dir: str, max_object_bytes: int):
+        self.enabled = enabled
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.entries_dir = os.path.join(self.cache_dir, "proxy-cache-entries")
+        self.max_object_bytes = max_object_bytes
+        # 按最近使用排序
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = 0
+        self._hits = 0
+        self._revalidated = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._disk_ready = False
+
+    def _prepare_disk(self):
+        """
+        磁盘索引不持久化，首次使用时清理上次运行遗留的文件
+
+        缓存文件放在缓存自己创建的子目录中，且只删除符合缓存命名规则的文件，
+        proxy_cache_dir 被误配置为其他目录时不会误删已有内容
+        """
+        if self._disk_ready or self.disk_bytes <= 0:
+            return
+        os.makedirs(self.entries_dir, exist_ok=True)
+        for name in os.listdir(self.entries_dir):
+            if _ENTRY_NAME.fullmatch(name):
+                try:
+                    os.remove(os.path.join(self.entries_dir, name))
+                except OSError:
+                    pass
+        self._disk_ready = True
+
+    def request_cacheable(self, method: str, headers: Mapping[str, str]) -> bool:
+        """只缓存不带 Range / Authorization 的 GET 请求"""
+        if not self.enabled or method != "GET":
+            return False
+        if "range" in headers or "authorization" in headers:
+            return False
+        return "no-store" not in parse_cache_control(headers.get("cache-control"))
+
+    @staticmethod
+    def wants_revalidation(headers: Mapping[str, str]) -> bool:
+        """浏览器强制刷新时发送 no-cache，即使缓存未过期也要重新验证"""
+        cc = parse_cache_control(headers.get("cache-control"))
+        return "no-cache" in cc or ("max-age" in cc and cc["max-age"] == "0") \
+            or headers.get("pragma", "").lower() == "no-cache"
+
+    def lookup(self, port: int, url: str, headers: Mapping[str, str]) -> Optional[CacheEntry]:
+        """查找与请求匹配（包括 Vary 指定的请求头）的缓存项"""
+        with self._lock:
+            entry = self._entries.get((port, url))
+            if entry is None:
+                self._misses += 1
+                return None
+            if any(headers.get(name, "") != value for name, value in entry.vary.items()):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(entry.key)
+            return entry
+
+    def record_hit(self, entry: CacheEntry, revalidated: bool):
+        with self._lock:
+            entry.hits += 1
+            if revalidated:
+                self._revalidated += 1
+            else:
+                self._hits += 1
+
+    def storable(self, status: int, headers: Mapping[str, str],
+                 request_headers: Mapping[str, str]) -> bool:
+        if not self.enabled or status != 200:
+            return False
+        try:
+            if int(headers.get("content-length", 0)) > self.max_object_bytes:
+                return False
+        except ValueError:
+            return False
+        return freshness_lifetime(headers, time.time(), "cookie" in request_headers) is not None
+
+    def store(self, port: int, url: str, request_headers: Mapping[str, str],
+              response_headers: Mapping[str, str], body: bytes):
+        """保存完整响应（阻塞：可能写磁盘，应在线程池中调用）"""
+        now = time.time()
+        lifetime = freshness_lifetime(response_headers, now, "cookie" in request_headers)
+        if lifetime is None or len(body) > self.max_object_bytes:
+            return
+        vary = {}
+        for name in response_headers.get("vary", "").split(","):
+            name = name.strip().lower()
+            if name:
+                vary[name] = request_headers.get(name, "")
+        headers = [(k.lower(), v) for k, v in response_headers.items()
+                   if k.lower() not in _NOT_STORED_HEADERS]
+        key = (port, url)
+        entry = CacheEntry(key, vary, headers, len(body), now + lifetime)
+
+        disk_path = None
+        if self.disk_bytes > 0 and len(body) <= self.disk_bytes:
+            self._prepare_disk()
+            # 文件名带上时间戳，替换同一 URL 的旧缓存时不会误删新文件
+            name = hashlib.sha1(repr((key, now)).encode()).hexdigest()
+            disk_path = os.path.join(self.entries_dir, name)
+            try:
+                with open(disk_path, "wb") as f:
+                    f.write(body)
+            except OSError:
+                disk_path = None
+
+        with self._lock:
+            self._remove(key)
+            entry.disk_path = disk_path
+            if disk_path:
+                self._disk_used += entry.size
+            if entry.size <= self.memory_bytes:
+                entry.body = body
+                self._memory_used += entry.size
+            if entry.body is None and entry.disk_path is None:
+                return
+            self._entries[key] = entry
+            self._evict()
+
+    def refresh(self, entry: CacheEntry, response_headers: Mapping[str, str]):
+        """上游返回 304 后，用新的响应头更新缓存项的新鲜期"""
+        merged = dict(entry.headers)
+        for k, v in response_headers.items():
+            if k.lower() not in _NOT_STORED_HEADERS and k.lower() != "content-length":
+                merged[k.lower()] = v
+        lifetime = freshness_lifetime(merged, time.time())
+        with self._lock:
+            if lifetime is None:
+                # 上游改为 private / no-store 等不可缓存的响应
+                if self._entries.get(entry.key) is entry:
+                    self._remove(entry.key)
+                return
+            entry.headers = list(merged.items())
+            entry.fresh_until = time.time() + lifetime
+
+    def read_body(self, entry: CacheEntry) -> Optional[bytes]:
+        """读取缓存的响应体，已被淘汰时返回 None（阻塞，应在线程池中调用）"""
+        body = entry.body
+        if body is not None:
+            return body
+        path = entry.disk_path
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            # 从磁盘读回后提升到内存
+            if entry.body is None and self._entries.get(entry.key) is entry \
+                    and entry.size <= self.memory_bytes:
+                entry.body = body
+                self._memory_used += entry.size
+                self._evict()
+        return body
+
+    def _remove(self, key: tuple):
+        """移除缓存项（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.body is not None:
+            self._memory_used -= entry.size
+            entry.body = None
+        if entry.disk_path is not None:
+            self._disk_used -= entry.size
+            try:
+                os.remove(entry.disk_path)
+            except OSError:
+                pass
+            entry.disk_path = None
+
+    def _evict(self):
+        """按 LRU 淘汰超出容量的内存和磁盘数据（调用方持有锁）"""
+        for entry in list(self._entries.values()):
+            if self._memory_used <= self.memory_bytes:
+                break
+            if entry.body is not None:
+                if entry.disk_path is None:
+                    self._remove(entry.key)
+                else:
+                    # 内存放不下时只保留磁盘副本
+                    entry.body = None
+                    self._memory_used -= entry.size
+        for entry in list(self._entries.values()):
+            if self._disk_used <= self.disk_bytes:
+                break
+            if entry.disk_path is not None:
+                self._remove(entry.key)
+
+    def clear(self, port: Optional[int] = None) -> int:
+        """清空指定端口（或全部）的缓存，返回移除的条目数"""
+        with self._lock:
+            keys = [key for key in self._entries if port is None or key[0] == port]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            ports: Dict[int, dict] = {}
+            for (port, _), entry in self._entries.items():
+                item = ports.setdefault(port, {"entries": 0, "bytes": 0})
+                item["entries"] += 1
+                item["bytes"] += entry.size
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "memory_limit": self.memory_bytes,
+                "disk_bytes": self._disk_used,
+                "disk_limit": self.disk_bytes,
+                "hits": self._hits,
+                "revalidated": self._revalidated,
+                "misses": self._misses,
+                "ports": ports,
+            }
+
+
+# 全局单例
+proxy_cache = ProxyCache(
+    enabled=settings.proxy_cache_enabled,
+    memory_bytes=settings.proxy_cache_memory_mb * 1024 * 1024,
+    disk_bytes=settings.proxy_cache_disk_mb * 1024 * 1024,
+    cache_dir=settings.proxy_cache_dir,
+    max_object_bytes=settings.proxy_cache_max_object_mb * 1024 * 1024,
+)
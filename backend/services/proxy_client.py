@@ -0,0 +1,158 @@
+"""
+反向代理 HTTP 客户端
+统一管理连接池、超时以及每个上游端口的并发上限，避免单个卡住的开发服务器
+占满连接池而影响对其他端口的代理
+"""
+import asyncio
+from typing import Dict
+
+import httpx
+
+from config import settings
+
+
+class UpstreamBusy(Exception):
+    """上游端口的并发请求已达上限，且排队超时"""
+
+
+class UpstreamLimiter:
+    """单个上游端口的并发限制与统计"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+def _abandon_acquire(task: asyncio.Future, semaphore: asyncio.Semaphore):
+    """放弃等待名额；acquire 已经完成（或在取消生效前完成）时归还名额"""
+    def give_back(t: asyncio.Future):
+        if not t.cancelled() and t.exception() is None:
+            semaphore.release()
+
+    if task.done():
+        give_back(task)
+    else:
+        task.cancel()
+        task.add_done_callback(give_back)
+
+
+async def _acquire_within(semaphore: asyncio.Semaphore, timeout: float) -> bool:
+    """
+    在 timeout 秒内取得名额，超时返回 False
+
+    不使用 asyncio.wait_for：Python 3.10/3.11 中 acquire 已成功后仍可能报超时，
+    取得的名额不会被归还，端口的并发上限随之永久减少
+    """
+    task = asyncio.ensure_future(semaphore.acquire())
+    try:
+        await asyncio.wait({task}, timeout=timeout)
+    except BaseException:
+        # 客户端断开等导致的取消
+        _abandon_acquire(task, semaphore)
+        raise
+    if task.done():
+        return True
+    _abandon_acquire(task, semaphore)
+    return False
+
+
+class ProxyClient:
+    """代理使用的共享 httpx 客户端"""
+
+    def __init__(self):
+        self.limits = httpx.Limits(
+            max_connections=settings.proxy_max_connections,
+            max_keepalive_connections=settings.proxy_max_keepalive_connections,
+            keepalive_expiry=settings.proxy_keepalive_expiry,
+        )
+        # 响应体以流式转发，读超时不设上限，以支持 SSE 等长连接；
+        # 等待响应头的时间由 response_timeout 单独限制
+        self.timeout = httpx.Timeout(
+            connect=settings.proxy_connect_timeout,
+            read=None,
+            write=settings.proxy_write_timeout,
+            pool=settings.proxy_pool_timeout,
+        )
+        self.response_timeout = settings.proxy_response_timeout
+        self.per_port_limit = settings.proxy_max_concurrency_per_port
+        self.queue_timeout = settings.proxy_queue_timeout
+        self._transport = httpx.AsyncHTTPTransport(limits=self.limits)
+        self.http = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=self.timeout,
+            follow_redirects=False,  # 不自动跟随重定向，由代理改写 Location
+        )
+        self._limiters: Dict[int, UpstreamLimiter] = {}
+
+    def limiter(self, port: int) -> UpstreamLimiter:
+        limiter = self._limiters.get(port)
+        if limiter is None:
+            limiter = self._limiters[port] = UpstreamLimiter(self.per_port_limit)
+        return limiter
+
+    async def acquire(self, port: int) -> UpstreamLimiter:
+        """占用端口的一个并发名额，排队超过 queue_timeout 时抛出 UpstreamBusy"""
+        limiter = self.limiter(port)
+        limiter.waiting += 1
+        try:
+            acquired = await _acquire_within(limiter.semaphore, self.queue_timeout)
+        finally:
+            limiter.waiting -= 1
+        if not acquired:
+            limiter.rejected += 1
+            raise UpstreamBusy(f"端口 {port} 的并发请求过多")
+        limiter.active += 1
+        limiter.requests += 1
+        return limiter
+
+    def release(self, port: int):
+        limiter = self._limiters[port]
+        limiter.active -= 1
+        limiter.semaphore.release()
+
+    def stats(self) -> dict:
+        """连接池与各端口的统计信息"""
+        connections = []
+        # httpx 未公开连接池对象，取不到时只返回配置和端口统计
+        pool = getattr(self._transport, "_pool", None)
+        for conn in getattr(pool, "connections", []):
+            try:
+                connections.append({"info": conn.info(), "idle": conn.is_idle()})
+            except Exception:
+                continue
+        return {
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+                "per_port": self.per_port_limit,
+            },
+            "pool": {
+                "connections": len(connections),
+                "idle": sum(1 for c in connections if c["idle"]),
+                "detail": connections,
+            },
+            "ports": {port: limiter.to_dict() for port, limiter in sorted(self._limiters.items())},
+        }
+
+    async def close(self):
+        await self.http.aclose()
+
+
+# 全局单例
+proxy_client = ProxyClient()
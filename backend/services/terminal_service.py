@@ -15,6 +15,11 @@ class TerminalService(ABC):
         """检查会话是否存在"""
         pass
 
+    @abstractmethod
+    def session_names(self) -> set[str]:
+        """获取所有存在的会话名（批量检查会话状态时代替逐个 session_exists）"""
+        pass
+
     @abstractmethod
     def create_session(self, session_name: str, work_dir: str, command: str = None) -> bool:
         """创建新会话"""
@@ -55,6 +60,11 @@ class TerminalService(ABC):
         """调整会话终端大小"""
         pass
 
+    @abstractmethod
+    def get_pane_pids(self, session_name: str) -> list[int]:
+        """获取会话中各窗格的 shell 进程 pid"""
+        pass
+
     @abstractmethod
     def get_output_queue(self, session_name: str) -> Optional[queue.Queue]:
         """获取输出队列（用于 WebSocket 实时推送）
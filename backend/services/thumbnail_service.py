@@ -0,0 +1,231 @@
+"""
+图片缩略图服务
+在进程池中生成固定尺寸的缩略图，按 路径 + mtime + 大小 缓存到磁盘，超出容量按 LRU 淘汰
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from config import settings
+from services.blocking_io import file_io_executor, run_io
+
+# 支持的缩略图边长（像素）
+THUMBNAIL_SIZES = (128, 256, 512)
+
+# 可生成缩略图的图片扩展名
+THUMBNAIL_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tif', '.tiff', '.ico'}
+
+THUMBNAIL_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+}
+
+
+class ThumbnailUnavailable(Exception):
+    """缺少 Pillow 或图片无法解码"""
+
+
+def pillow_available() -> bool:
+    """检测是否安装了 Pillow"""
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def render_thumbnail(src: str, dst_base: str, size: int) -> str:
+    """
+    生成缩略图（在子进程中执行）
+
+    有透明通道的图片保存为 PNG，其余保存为 JPEG。返回实际写入的文件路径。
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as img:
+        # JPEG 可在解码阶段直接缩小，大幅减少解码开销
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if has_alpha:
+            dst = dst_base + '.png'
+            img = img.convert('RGBA')
+            fmt, options = 'PNG', {'optimize': True}
+        else:
+            dst = dst_base + '.jpg'
+            img = img.convert('RGB')
+            fmt, options = 'JPEG', {'quality': 80, 'optimize': True}
+
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        img.save(tmp, fmt, **options)
+        os.replace(tmp, dst)
+        return dst
+
+
+class ThumbnailCache:
+    """缩略图磁盘缓存（LRU，按总字节数限制容量）"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, workers: int):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        # {文件名: 字节数}，按最近使用排序
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._lock = Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _load(self):
+        """首次使用时扫描缓存目录，按访问时间恢复 LRU 顺序"""
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    st = entry.stat()
+                    files.append((st.st_atime, entry.name, st.st_size))
+        files.sort()
+        for _, name, size in files:
+            self._entries[name] = size
+            self._total += size
+        self._loaded = True
+
+    @staticmethod
+    def cache_key(path: str, stat: os.stat_result, size: int) -> str:
+        raw = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{size}"
+        return hashlib.sha1(raw.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+            for ext in THUMBNAIL_MEDIA_TYPES:
+                name = key + ext
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    file_path = os.path.join(self.cache_dir, name)
+                    if os.path.exists(file_path):
+                        return file_path
+                    self._total -= self._entries.pop(name)
+        return None
+
+    def _record(self, file_path: str):
+        """登记新生成的缩略图，并淘汰最久未使用的条目"""
+        name = os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        evicted = []
+        with self._lock:
+            if name in self._entries:
+                self._total -= self._entries.pop(name)
+            self._entries[name] = size
+            self._total += size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name))
+            except OSError:
+                pass
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _finish(self, key: str, future: asyncio.Future):
+        """生成结束（无论发起请求的客户端是否已断开）后登记缓存"""
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        # 登记时会读取文件大小并删除被淘汰的文件，放到文件 I/O 线程池执行
+        file_io_executor.submit(self._record_quietly, future.result())
+
+    def _record_quietly(self, file_path: str):
+        try:
+            self._record(file_path)
+        except OSError:
+            pass
+
+    async def _render(self, path: str, key: str, size: int) -> str:
+        """生成缩略图，同一缩略图的并发请求共享同一次生成"""
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(), render_thumbnail,
+                path, os.path.join(self.cache_dir, key), size
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        try:
+            # 某个客户端断开只取消它自己的等待，不取消其他请求共享的生成任务
+            return await asyncio.shield(future)
+        except Exception as e:
+            raise ThumbnailUnavailable(f"无法生成缩略图: {e}")
+
+    def _read(self, file_path: str) -> Optional[bytes]:
+        """读取缓存文件，已被淘汰时返回 None"""
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                size = self._entries.pop(os.path.basename(file_path), None)
+                if size is not None:
+                    self._total -= size
+            return None
+        # 更新访问时间，重启后仍能恢复 LRU 顺序
+        try:
+            now = time.time()
+            os.utime(file_path, (now, os.stat(file_path).st_mtime))
+        except OSError:
+            pass
+        return data
+
+    async def get(self, path: str, size: int) -> Tuple[bytes, str]:
+        """
+        获取缩略图，返回 (图片字节, MIME 类型)
+
+        命中缓存直接读取；同一缩略图的并发请求只生成一次。
+        返回内容而不是缓存文件路径：文件随时可能被其他请求触发的淘汰删除，
+        读取时已被删除则重新生成。
+        """
+        if not pillow_available():
+            raise ThumbnailUnavailable("服务器未安装 Pillow，无法生成缩略图")
+
+        stat = await run_io(os.stat, path)
+        key = self.cache_key(path, stat, size)
+        for _ in range(3):
+            cached = await run_io(self._lookup, key)
+            if cached is None:
+                cached = await self._render(path, key, size)
+            data = await run_io(self._read, cached)
+            if data is not None:
+                ext = os.path.splitext(cached)[1]
+                return data, THUMBNAIL_MEDIA_TYPES[ext]
+        raise ThumbnailUnavailable("缩略图缓存容量不足，生成后立即被淘汰")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局单例
+thumbnail_cache = ThumbnailCache(
+    settings.thumbnail_cache_dir,
+    settings.thumbnail_cache_max_mb * 1024 * 1024,
+    settings.thumbnail_workers,
+)
@@ -33,6 +33,13 @@ class TmuxService(TerminalService):
         success, _ = self._run_tmux("has-session", "-t", session_name)
         return success
 
+    def session_names(self) -> set[str]:
+        """获取所有存在的会话名"""
+        success, output = self._run_tmux("list-sessions", "-F", "#{session_name}")
+        if not success:
+            return set()
+        return set(output.split())
+
     def create_session(self, session_name: str, work_dir: str, command: str = None) -> bool:
         """创建新会话"""
         # 展开 ~ 为实际用户目录
@@ -122,6 +129,13 @@ class TmuxService(TerminalService):
         )
         return success
 
+    def get_pane_pids(self, session_name: str) -> list[int]:
+        """获取会话所有窗口中各窗格的进程 pid"""
+        success, output = self._run_tmux("list-panes", "-s", "-t", session_name, "-F", "#{pane_pid}")
+        if not success:
+            return []
+        return [int(line) for line in output.split() if line.isdigit()]
+
     def get_output_queue(self, session_name: str) -> Optional[queue.Queue]:
         """tmux 不支持队列方式，返回 None 使用轮询"""
         return None
@@ -0,0 +1,234 @@
+"""
+分块上传服务
+支持断点续传：按偏移量顺序追加分块，分块/整体 SHA-256 校验，完成后原子重命名
+"""
+import hashlib
+import os
+import time
+import uuid
+from threading import Lock
+from typing import Dict, Optional
+
+from config import settings
+
+
+class UploadError(Exception):
+    """上传错误基类"""
+
+
+class UploadNotFound(UploadError):
+    """上传会话不存在或已过期"""
+
+
+class UploadBusy(UploadError):
+    """该上传会话正在写入其他分块"""
+
+
+class OffsetMismatch(UploadError):
+    """分块偏移量与服务端已接收字节数不一致"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"偏移量不匹配，服务端已接收 {expected} 字节")
+        self.expected = expected
+
+
+class ChecksumMismatch(UploadError):
+    """校验和不一致"""
+
+
+class UploadSession:
+    """单个上传会话（临时文件与目标文件在同一目录，保证可原子重命名）"""
+
+    def __init__(self, path: str, size: int, sha256: Optional[str], overwrite: bool):
+        self.upload_id = uuid.uuid4().hex
+        self.path = path
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.overwrite = overwrite
+        directory, name = os.path.split(path)
+        self.part_path = os.path.join(directory, f".{name}.{self.upload_id}.part")
+        self.received = 0
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.busy = False
+        # 顺序写入，整体哈希随分块增量更新，完成时无需重读文件
+        self._hash = hashlib.sha256()
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "path": self.path,
+            "size": self.size,
+            "offset": self.received,
+            "complete": self.received == self.size,
+        }
+
+
+class ChunkWriter:
+    """
+    写入一个分块
+
+    write() 逐段写入请求体，commit() 校验并提交；
+    中途断开时调用 rollback()，未提供分块校验和时保留已写入部分以便续传。
+    """
+
+    def __init__(self, manager: 'UploadManager', session: UploadSession, chunk_sha256: Optional[str]):
+        self.manager = manager
+        self.session = session
+        self.chunk_sha256 = chunk_sha256.lower() if chunk_sha256 else None
+        self.start = session.received
+        self.written = 0
+        self._chunk_hash = hashlib.sha256() if chunk_sha256 else None
+        self._total_hash = session._hash.copy()
+        self._file = open(session.part_path, 'r+b')
+        self._file.seek(self.start)
+
+    def write(self, data: bytes):
+        if self.start + self.written + len(data) > self.session.size:
+            raise UploadError("写入数据超过声明的文件大小")
+        self._file.write(data)
+        self.written += len(data)
+        self._total_hash.update(data)
+        if self._chunk_hash is not None:
+            self._chunk_hash.update(data)
+
+    def commit(self) -> UploadSession:
+        try:
+            if self._chunk_hash is not None and self._chunk_hash.hexdigest() != self.chunk_sha256:
+                self._truncate()
+                raise ChecksumMismatch("分块校验失败")
+            self._file.flush()
+            self.session.received = self.start + self.written
+            self.session._hash = self._total_hash
+            return self.session
+        finally:
+            self._close()
+
+    def rollback(self):
+        """写入中断：无分块校验时保留已写入数据，否则回退到分块起点"""
+        try:
+            if self._chunk_hash is None:
+                self._file.flush()
+                self.session.received = self.start + self.written
+                self.session._hash = self._total_hash
+            else:
+                self._truncate()
+        finally:
+            self._close()
+
+    def _truncate(self):
+        self._file.truncate(self.start)
+
+    def _close(self):
+        self._file.close()
+        self.session.updated_at = time.time()
+        self.manager._release(self.session)
+
+
+class UploadManager:
+    """上传会话管理器"""
+
+    def __init__(self):
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = Lock()
+
+    def create(self, path: str, size: int, sha256: Optional[str] = None,
+               overwrite: bool = False) -> UploadSession:
+        """创建上传会话并生成空的临时文件"""
+        self.cleanup_expired()
+        session = UploadSession(path, size, sha256, overwrite)
+        with open(session.part_path, 'wb'):
+            pass
+        with self._lock:
+            self._sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadNotFound("上传会话不存在或已过期")
+        return session
+
+    def open_chunk(self, upload_id: str, offset: int, chunk_sha256: Optional[str] = None) -> ChunkWriter:
+        """开始写入分块，offset 必须等于已接收字节数"""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise UploadNotFound("上传会话不存在或已过期")
+            if session.busy:
+                raise UploadBusy("该上传正在写入其他分块")
+            if offset != session.received:
+                raise OffsetMismatch(session.received)
+            session.busy = True
+        try:
+            return ChunkWriter(self, session, chunk_sha256)
+        except Exception:
+            self._release(session)
+            raise
+
+    def complete(self, upload_id: str) -> UploadSession:
+        """校验完整性并原子重命名为目标文件"""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise UploadNotFound("上传会话不存在或已过期")
+            if session.busy:
+                raise UploadBusy("该上传正在写入分块")
+            if session.received != session.size:
+                raise OffsetMismatch(session.received)
+            session.busy = True
+
+        try:
+            if session.sha256 and session._hash.hexdigest() != session.sha256:
+                self._discard(session)
+                raise ChecksumMismatch("文件校验失败，请重新上传")
+            if not session.overwrite and os.path.exists(session.path):
+                raise FileExistsError(session.path)
+            with open(session.part_path, 'rb+') as f:
+                os.fsync(f.fileno())
+            os.replace(session.part_path, session.path)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            return session
+        finally:
+            self._release(session)
+
+    def abort(self, upload_id: str):
+        """取消上传并删除临时文件（正在写入分块或合并时拒绝）"""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise UploadNotFound("上传会话不存在或已过期")
+            if session.busy:
+                raise UploadBusy("该上传正在写入分块")
+            # 删除临时文件前不再接受新的分块
+            session.busy = True
+        self._discard(session)
+
+    def cleanup_expired(self):
+        """清理长时间无进展的上传"""
+        expire_before = time.time() - settings.upload_expire_hours * 3600
+        with self._lock:
+            expired = [s for s in self._sessions.values()
+                       if not s.busy and s.updated_at < expire_before]
+            for session in expired:
+                session.busy = True
+        for session in expired:
+            self._discard(session)
+
+    def _discard(self, session: UploadSession):
+        with self._lock:
+            self._sessions.pop(session.upload_id, None)
+        try:
+            os.remove(session.part_path)
+        except OSError:
+            pass
+
+    def _release(self, session: UploadSession):
+        with self._lock:
+            session.busy = False
+
+
+# 全局单例
+upload_manager = UploadManager()
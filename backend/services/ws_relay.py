@@ -0,0 +1,179 @@
+"""
+WebSocket 代理转发
+在客户端与上游之间双向转发消息：任一方向结束即关闭两端并传递关闭码，
+消息大小与缓冲区有上限，上游连接由 websockets 负责 ping/pong 保活
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional, Set
+
+import websockets
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 不能出现在关闭帧中的保留关闭码
+_RESERVED_CLOSE_CODES = {1004, 1005, 1006, 1015}
+
+CLOSE_NORMAL = 1000
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+
+
+def forwardable_close_code(code: Optional[int]) -> int:
+    """把对端的关闭码转换为可以发送给另一端的关闭码"""
+    if code is None or code == 1005:
+        return CLOSE_NORMAL
+    if code in _RESERVED_CLOSE_CODES or not 1000 <= code <= 4999:
+        return CLOSE_INTERNAL_ERROR
+    return code
+
+
+def _byte_size(data) -> int:
+    return len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+
+
+async def connect_upstream(url: str, client: WebSocket):
+    """
+    连接上游 WebSocket
+
+    转发客户端请求的子协议；客户端协商了 permessage-deflate 时上游也启用压缩。
+    """
+    subprotocols = [p.strip() for p in client.headers.get("sec-websocket-protocol", "").split(",") if p.strip()]
+    client_deflate = "permessage-deflate" in client.headers.get("sec-websocket-extensions", "")
+    return await websockets.connect(
+        url,
+        subprotocols=subprotocols or None,
+        compression="deflate" if client_deflate else None,
+        open_timeout=settings.proxy_connect_timeout,
+        ping_interval=settings.proxy_ws_ping_interval,
+        ping_timeout=settings.proxy_ws_ping_timeout,
+        close_timeout=settings.proxy_ws_close_timeout,
+        max_size=settings.proxy_ws_max_message_mb * 1024 * 1024,
+        max_queue=settings.proxy_ws_max_queue,
+    )
+
+
+class WebSocketRelay:
+    """单个代理 WebSocket 连接的双向转发及统计"""
+
+    def __init__(self, client: WebSocket, upstream, port: int, path: str):
+        self.client = client
+        self.upstream = upstream
+        self.port = port
+        self.path = path
+        self.max_message_size = settings.proxy_ws_max_message_mb * 1024 * 1024
+        self.started_at = time.time()
+        self.messages_in = 0  # 客户端 → 上游
+        self.bytes_in = 0
+        self.messages_out = 0  # 上游 → 客户端
+        self.bytes_out = 0
+        self.closed_by: Optional[str] = None
+        self.close_code: Optional[int] = None
+
+    async def run(self):
+        """转发直到任一方向结束，然后关闭两端"""
+        active_relays.add(self)
+        tasks = [
+            asyncio.ensure_future(self._client_to_upstream()),
+            asyncio.ensure_future(self._upstream_to_client()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._close_both(CLOSE_INTERNAL_ERROR, "")
+            active_relays.discard(self)
+            logger.info(
+                f"WebSocket 代理结束: {self.port}/{self.path} 由 {self.closed_by or 'proxy'} 关闭 "
+                f"code={self.close_code} in={self.messages_in}/{self.bytes_in}B "
+                f"out={self.messages_out}/{self.bytes_out}B"
+            )
+
+    async def _client_to_upstream(self):
+        try:
+            while True:
+                message = await self.client.receive()
+                if message["type"] == "websocket.disconnect":
+                    self._record_close("client", message.get("code"))
+                    await self.upstream.close(code=forwardable_close_code(self.close_code),
+                                              reason=message.get("reason") or "")
+                    return
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes") or b""
+                size = _byte_size(data)
+                if size > self.max_message_size:
+                    self._record_close("proxy", CLOSE_MESSAGE_TOO_BIG)
+                    await self._close_both(CLOSE_MESSAGE_TOO_BIG, "消息过大")
+                    return
+                # send 在上游写缓冲区满时等待，背压会传回客户端
+                await self.upstream.send(data)
+                self.messages_in += 1
+                self.bytes_in += size
+        except WebSocketDisconnect as e:
+            self._record_close("client", e.code)
+            await self.upstream.close(code=forwardable_close_code(e.code))
+        except websockets.ConnectionClosed:
+            # 上游已关闭，由另一方向处理
+            return
+
+    async def _upstream_to_client(self):
+        try:
+            async for data in self.upstream:
+                if isinstance(data, str):
+                    await self.client.send_text(data)
+                else:
+                    await self.client.send_bytes(data)
+                self.messages_out += 1
+                self.bytes_out += _byte_size(data)
+        except websockets.ConnectionClosed:
+            pass
+        self._record_close("upstream", self.upstream.close_code)
+        await self._close_client(forwardable_close_code(self.upstream.close_code),
+                                 self.upstream.close_reason or "")
+
+    def _record_close(self, side: str, code: Optional[int]):
+        if self.closed_by is None:
+            self.closed_by = side
+            self.close_code = code
+
+    async def _close_client(self, code: int, reason: str):
+        if self.client.application_state == WebSocketState.CONNECTED \
+                and self.client.client_state == WebSocketState.CONNECTED:
+            try:
+                await self.client.close(code=code, reason=reason)
+            except Exception:
+                pass
+
+    async def _close_both(self, code: int, reason: str):
+        await self._close_client(code, reason)
+        try:
+            await self.upstream.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port,
+            "path": self.path,
+            "duration": round(time.time() - self.started_at, 1),
+            "messages_in": self.messages_in,
+            "bytes_in": self.bytes_in,
+            "messages_out": self.messages_out,
+            "bytes_out": self.bytes_out,
+        }
+
+
+active_relays: Set[WebSocketRelay] = set()
+
+
+def relay_stats() -> List[dict]:
+    """当前活动的代理 WebSocket 连接统计"""
+    return [relay.to_dict() for relay in active_relays]